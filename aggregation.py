@@ -0,0 +1,125 @@
+import gzip
+import json
+import logging
+import urllib.error
+import urllib.request
+from threading import Thread, Event
+
+logger = logging.getLogger(__name__)
+
+class EdgePusher:
+    """Push batches of locally saved count events from an edge node to a central aggregator.
+
+    Events are read from the node's own database, which doubles as the offline buffer:
+    nothing is dropped while the aggregator is unreachable, and pushing resumes from the
+    aggregator's last acknowledged sequence number once it is back.
+    """
+
+    def __init__(self, aggregator_url, node_id, fetch_events, building='', floor='',
+                 token=None, interval=2.0, batch_size=500, max_backoff=60.0):
+        """fetch_events(after_seq, limit) must return [(seq, timestamp, direction, people_count), ...]
+        with timezone-aware timestamps, so nodes and aggregator agree on the day of each event
+        """
+        self.aggregator_url = aggregator_url.rstrip('/')
+        self.node_id = node_id
+        self.fetch_events = fetch_events
+        self.building = building
+        self.floor = floor
+        self.token = token
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+
+        self.acked_seq = None  # Unknown until the aggregator tells us
+        self.stop_event = Event()
+        self.thread = None
+
+        # Metrics
+        self.pushed_events = 0
+        self.failed_pushes = 0
+
+    def request(self, method, path, payload=None):
+        """Send a (gzip-compressed) JSON request to the aggregator and return the decoded reply"""
+        headers = {'Accept': 'application/json'}
+        data = None
+        if payload is not None:
+            data = gzip.compress(json.dumps(payload, separators=(',', ':')).encode())
+            headers['Content-Type'] = 'application/json'
+            headers['Content-Encoding'] = 'gzip'
+        if self.token:
+            headers['X-Aggregation-Token'] = self.token
+
+        req = urllib.request.Request(self.aggregator_url + path, data=data, headers=headers, method=method)
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return json.loads(response.read())
+
+    def sync_cursor(self):
+        """Ask the aggregator which of our events it already has"""
+        reply = self.request('GET', f'/api/aggregate/nodes/{self.node_id}')
+        self.acked_seq = reply.get('last_seq', 0)
+        logger.info(f"📡 Aggregator has events up to #{self.acked_seq} for node {self.node_id}")
+
+    def push_once(self):
+        """Push one batch; returns the number of events acknowledged"""
+        if self.acked_seq is None:
+            self.sync_cursor()
+
+        events = self.fetch_events(self.acked_seq, self.batch_size)
+        if not events:
+            return 0
+
+        payload = {
+            'node_id': self.node_id,
+            'building': self.building,
+            'floor': self.floor,
+            # [seq, ISO timestamp, direction, people count]
+            'events': [[seq, timestamp.isoformat(), direction, people_count]
+                       for seq, timestamp, direction, people_count in events]
+        }
+        reply = self.request('POST', '/api/aggregate/ingest', payload)
+        acked = reply['last_seq'] - self.acked_seq
+        self.acked_seq = reply['last_seq']
+        self.pushed_events += acked
+        return acked
+
+    def run(self):
+        backoff = self.interval
+        while not self.stop_event.is_set():
+            try:
+                pushed = self.push_once()
+                backoff = self.interval
+                # Keep draining a backlog without waiting between full batches
+                if pushed >= self.batch_size:
+                    continue
+            except (urllib.error.URLError, OSError, ValueError, KeyError) as e:
+                self.failed_pushes += 1
+                # Re-sync the cursor after an outage in case a reply was lost mid-push
+                self.acked_seq = None
+                backoff = min(backoff * 2, self.max_backoff)
+                logger.warning(f"⚠️ Push to aggregator failed ({e}), retrying in {backoff:.1f}s")
+            except Exception as e:
+                self.failed_pushes += 1
+                backoff = min(backoff * 2, self.max_backoff)
+                logger.error(f"❌ Unexpected error pushing events: {e}")
+            self.stop_event.wait(backoff)
+
+    def start(self):
+        """Start pushing in a background thread"""
+        self.thread = Thread(target=self.run, name='edge-pusher', daemon=True)
+        self.thread.start()
+        logger.info(f"✅ Edge pusher started: node {self.node_id} -> {self.aggregator_url}")
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5.0)
+
+    def stats(self):
+        return {
+            'node_id': self.node_id,
+            'aggregator_url': self.aggregator_url,
+            'acked_seq': self.acked_seq,
+            'pushed_events': self.pushed_events,
+            'failed_pushes': self.failed_pushes
+        }
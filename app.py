@@ -1,12 +1,21 @@
 from flask import Flask, redirect, url_for, request, flash, render_template, Response, jsonify
 from flask_bootstrap import Bootstrap5
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, Date, Float, Enum
-from datetime import datetime, date
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, Session
+from sqlalchemy import Integer, String, Text, ForeignKey, DateTime, Date, Float, Enum, UniqueConstraint, func, inspect, text
+from sqlalchemy import event as sa_event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime, date, timedelta, timezone
+from threading import Lock, Thread
 import os
+import math
+import time
+import gzip
+import json
+import socket
 import logging
 import enum
+import uuid
 
 # Set up logging
 logging.basicConfig(
@@ -20,9 +29,38 @@ bootstrap = Bootstrap5(app)
 
 # Configuration
 app.config['SECRET_KEY'] = '*#*hE*H@#*@(#H#*$#jkr(*$))'
-db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'people_counter.db')
+db_path = os.environ.get('PEOPLE_COUNTER_DB',
+                         os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'people_counter.db'))
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Headless mode counts people without drawing or encoding frames on the server;
+# browsers overlay detections from /detections_feed on a raw feed instead
+app.config['HEADLESS'] = os.environ.get('PEOPLE_COUNTER_HEADLESS', '0') == '1'
+# Multi-node aggregation: edge nodes push saved events to AGGREGATOR_URL; any node accepts
+# pushes at /api/aggregate/ingest (protected by AGGREGATION_TOKEN when set)
+app.config['AGGREGATOR_URL'] = os.environ.get('PEOPLE_COUNTER_AGGREGATOR_URL')
+app.config['AGGREGATION_TOKEN'] = os.environ.get('PEOPLE_COUNTER_AGGREGATION_TOKEN')
+app.config['NODE_ID'] = os.environ.get('PEOPLE_COUNTER_NODE_ID', socket.gethostname())
+app.config['NODE_BUILDING'] = os.environ.get('PEOPLE_COUNTER_BUILDING', 'main')
+app.config['NODE_FLOOR'] = os.environ.get('PEOPLE_COUNTER_FLOOR', '1')
+# Capture settings from the environment: variable -> (DEFAULT_CAPTURE_CONFIG key, parser).
+# Only variables that are set are passed on, so camera_controller.py keeps the defaults. E.g.
+# PEOPLE_COUNTER_CAPTURE_BACKEND=v4l2 PEOPLE_COUNTER_FOURCC=MJPG for USB cameras, or
+# PEOPLE_COUNTER_CAPTURE_BACKEND=gstreamer PEOPLE_COUNTER_SOURCE=rtsp://... for streams
+CAPTURE_ENV = {
+    'PEOPLE_COUNTER_SOURCE': ('source', str),
+    'PEOPLE_COUNTER_CAPTURE_BACKEND': ('backend', str),
+    'PEOPLE_COUNTER_FOURCC': ('fourcc', str),
+    'PEOPLE_COUNTER_CAPTURE_WIDTH': ('width', int),
+    'PEOPLE_COUNTER_CAPTURE_HEIGHT': ('height', int),
+    'PEOPLE_COUNTER_CAPTURE_FPS': ('fps', int),
+    'PEOPLE_COUNTER_CAPTURE_BUFFER': ('buffer_size', int),
+    'PEOPLE_COUNTER_MIRROR': ('mirror', lambda value: value == '1'),
+    'PEOPLE_COUNTER_ADAPTIVE_INFERENCE': ('adaptive_inference', lambda value: value == '1'),
+    'PEOPLE_COUNTER_TARGET_FPS': ('target_fps', float),
+}
+app.config['CAPTURE'] = {key: parse(os.environ[name])
+                         for name, (key, parse) in CAPTURE_ENV.items() if os.environ.get(name)}
 
 class Base(DeclarativeBase):
     pass
@@ -47,12 +85,18 @@ class CountSession(db.Model):
 
 class CountEvent(db.Model):
     """Table to store individual entry/exit events"""
+    # IDs are the sequence numbers pushed to the aggregator, so they must never be reused,
+    # not even after /reset_counts deletes every event
+    __table_args__ = {'sqlite_autoincrement': True}
+    
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
-    session_id: Mapped[int] = mapped_column(ForeignKey('count_session.id'))
-    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    session_id: Mapped[int] = mapped_column(ForeignKey('count_session.id'), index=True)
+    timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
     direction: Mapped[Direction] = mapped_column(Enum(Direction))
     people_count: Mapped[int] = mapped_column(Integer, default=1)
     detection_confidence: Mapped[float] = mapped_column(Float, default=0.0)
+    # ID assigned when the crossing is detected, so saving the same event twice is detectable
+    event_uid: Mapped[str] = mapped_column(String(32), unique=True, index=True, nullable=True)
     
     session = relationship('CountSession', back_populates='events')
 
@@ -65,12 +109,64 @@ class DailyCount(db.Model):
     peak_occupancy: Mapped[int] = mapped_column(Integer, default=0)
     current_occupancy: Mapped[int] = mapped_column(Integer, default=0)
 
+class NodeState(db.Model):
+    """Aggregator table: ingestion cursor and placement of each edge node"""
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
+    node_id: Mapped[str] = mapped_column(String(100), unique=True)
+    building: Mapped[str] = mapped_column(String(100), default='main')
+    floor: Mapped[str] = mapped_column(String(50), default='1')
+    last_seq: Mapped[int] = mapped_column(Integer, default=0)
+    last_seen: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class NodeDailyCount(db.Model):
+    """Aggregator table: per-node daily totals, summed into building/floor occupancy"""
+    __table_args__ = (UniqueConstraint('node_id', 'date'),)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True, unique=True)
+    node_id: Mapped[str] = mapped_column(String(100), index=True)
+    date: Mapped[date] = mapped_column(Date, index=True)
+    total_entries: Mapped[int] = mapped_column(Integer, default=0)
+    total_exits: Mapped[int] = mapped_column(Integer, default=0)
+
 # Import camera functionality
 from camera_controller import PeopleCounterCamera
+from aggregation import EdgePusher
+from occupancy_series import OccupancySeries, RESOLUTIONS
 
 # Global camera instance
 people_counter_camera = None
 
+# Serializes saving of count events between request threads and the background saver
+event_save_lock = Lock()
+
+# Bumped whenever saved totals change; used as the /api/stats ETag
+stats_version = 0
+# The version only counts this process's writes, so tags also carry a per-process token.
+# With several worker processes, a worker does not see another worker's writes and may
+# still answer 304, so the ETag scheme assumes a single process (like the camera does).
+stats_etag_token = f'{os.getpid():x}{int(time.time()):x}'
+
+# Longest time /api/events holds a request open waiting for new events
+MAX_LONG_POLL_SECONDS = 25.0
+
+# Serializes ingestion of pushed batches on an aggregator
+aggregate_lock = Lock()
+
+# Edge pusher, when this node reports to an aggregator
+edge_pusher = None
+
+# Occupancy over time for dashboard charts, kept in memory and saved next to the database
+occupancy_series = OccupancySeries(os.path.join(os.path.dirname(db_path), 'occupancy_series.npz'))
+
+def stream_fps(value):
+    """Validate an fps query parameter: anything but a positive finite number means no limit"""
+    if value is None or not math.isfinite(value) or value <= 0:
+        return None
+    return value
+
+def create_camera():
+    """Create the camera using the configured capture settings and mode"""
+    return PeopleCounterCamera(headless=app.config['HEADLESS'], capture=app.config['CAPTURE'])
+
 def get_or_create_daily_count(target_date=None):
     """Get or create daily count record for specified date"""
     if target_date is None:
@@ -132,7 +228,9 @@ def index():
                              current_session=current_session,
                              today_count=today_count,
                              current_occupancy=current_occupancy,
-                             recent_events=recent_events)
+                             recent_events=recent_events,
+                             headless=app.config['HEADLESS'],
+                             event_cursor=people_counter_camera.count_events.latest_seq if people_counter_camera else 0)
         
     except Exception as e:
         logger.error(f"Error in index route: {e}")
@@ -141,7 +239,8 @@ def index():
                              current_session=None,
                              today_count=None,
                              current_occupancy=0,
-                             recent_events=[])
+                             recent_events=[],
+                             headless=app.config['HEADLESS'])
 
 @app.route('/start_counter')
 def start_counter():
@@ -150,10 +249,13 @@ def start_counter():
     try:
         if people_counter_camera is None:
             logger.info("Creating new people counter camera instance")
-            people_counter_camera = PeopleCounterCamera()
+            people_counter_camera = create_camera()
         else:
             logger.info("Camera already running, reusing existing instance")
         
+        # Counting runs in the background whether or not anyone is watching the feed
+        people_counter_camera.start()
+        
         # Ensure we have an active session
         current_session = CountSession.query.filter_by(end_time=None).first()
         if not current_session:
@@ -178,7 +280,7 @@ def video_feed():
     global people_counter_camera
     if people_counter_camera is None:
         logger.info("Initializing camera for video feed")
-        people_counter_camera = PeopleCounterCamera()
+        people_counter_camera = create_camera()
         
         # Ensure we have an active session
         current_session = CountSession.query.filter_by(end_time=None).first()
@@ -189,120 +291,185 @@ def video_feed():
             db.session.commit()
             logger.info(f"Created new session {current_session.id}")
     
-    return Response(people_counter_camera.generate_frames(),
+    # Optional per-stream encoding parameters, e.g. /video_feed?width=640&quality=60&fps=10
+    width = request.args.get('width', type=int)
+    quality = request.args.get('quality', type=int)
+    max_fps = stream_fps(request.args.get('fps', type=float))
+    if quality is not None:
+        quality = min(max(quality, 10), 95)
+    # Raw (un-annotated) feed by default in headless mode, e.g. /video_feed?overlay=0
+    overlay = request.args.get('overlay', '0' if app.config['HEADLESS'] else '1') == '1'
+    
+    return Response(people_counter_camera.generate_frames(width=width, quality=quality,
+                                                          max_fps=max_fps, overlay=overlay),
                    mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/check_count_events')
-def check_count_events():
-    """Check for new count events and save to database with enhanced reliability"""
+@app.route('/detections_feed')
+def detections_feed():
+    """Server-sent event stream of per-frame boxes and track IDs for client-side overlays"""
     global people_counter_camera
-    
     if people_counter_camera is None:
-        logger.warning("Check count events called but camera not initialized")
-        return jsonify({'status': 'error', 'message': 'Camera not initialized'})
+        logger.info("Initializing camera for detections feed")
+        people_counter_camera = create_camera()
     
-    try:
-        events = people_counter_camera.get_and_clear_events()
-        if events:
-            logger.info(f"🔄 Processing {len(events)} count events for automatic saving")
-            
-            # Ensure we have an active session (create if needed)
-            current_session = CountSession.query.filter_by(end_time=None).first()
-            if not current_session:
-                logger.info("📝 Auto-creating new counting session")
-                current_session = CountSession()
-                db.session.add(current_session)
+    max_fps = stream_fps(request.args.get('fps', type=float))
+    return Response(people_counter_camera.generate_detections(max_fps=max_fps),
+                   mimetype='text/event-stream',
+                   headers={'Cache-Control': 'no-cache'})
+
+def bump_stats_version():
+    """Invalidate cached /api/stats responses after saved totals change"""
+    global stats_version
+    stats_version += 1
+
+@sa_event.listens_for(Session, 'after_flush')
+def track_stats_changes(session, flush_context):
+    """Note flushes that change sessions, events or daily totals so their commit bumps the version"""
+    changed = list(session.new) + list(session.deleted) + [obj for obj in session.dirty if session.is_modified(obj)]
+    if any(isinstance(obj, (CountSession, CountEvent, DailyCount)) for obj in changed):
+        session.info['stats_changed'] = True
+
+@sa_event.listens_for(Session, 'do_orm_execute')
+def track_bulk_stats_changes(orm_execute_state):
+    """Bulk inserts, updates and deletes bypass the flush, so note those separately"""
+    if orm_execute_state.is_select:
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in (CountSession, CountEvent, DailyCount):
+        orm_execute_state.session.info['stats_changed'] = True
+
+@sa_event.listens_for(Session, 'after_commit')
+def bump_stats_version_on_commit(session):
+    if session.info.pop('stats_changed', False):
+        bump_stats_version()
+
+@sa_event.listens_for(Session, 'after_rollback')
+def forget_stats_changes(session):
+    session.info.pop('stats_changed', None)
+
+def save_pending_events(camera):
+    """Save count events the database has not seen yet; returns a summary dict or None if there were none"""
+    with event_save_lock:
+        events = camera.get_and_clear_events()
+        if not events:
+            return None
+        
+        logger.info(f"🔄 Processing {len(events)} count events for automatic saving")
+        
+        # Ensure we have an active session (create if needed)
+        current_session = CountSession.query.filter_by(end_time=None).first()
+        if not current_session:
+            logger.info("📝 Auto-creating new counting session")
+            current_session = CountSession()
+            db.session.add(current_session)
+            try:
+                db.session.commit()
+                logger.info(f"✅ Created session {current_session.id}")
+            except Exception as e:
+                logger.error(f"❌ Failed to create session: {e}")
+                db.session.rollback()
+                return {'status': 'error', 'message': f'Failed to create session: {e}'}
+        
+        # Get today's daily count (create if needed)
+        today_count = get_or_create_daily_count()
+        
+        saved_events = []
+        failed_events = []
+        
+        for event_idx, event in enumerate(events):
+            try:
+                # Create count event record with automatic retry
+                count_event = CountEvent(
+                    session_id=current_session.id,
+                    direction=Direction.IN if event['direction'] == 'IN' else Direction.OUT,
+                    people_count=event.get('people_count', 1),
+                    detection_confidence=event.get('confidence', 0.0),
+                    event_uid=event.get('event_id')
+                )
+                db.session.add(count_event)
+                
+                # Update session totals automatically
+                if event['direction'] == 'IN':
+                    current_session.total_entries += event.get('people_count', 1)
+                    today_count.total_entries += event.get('people_count', 1)
+                    logger.info(f"➡️ Auto-saved ENTRY event #{event_idx + 1}")
+                else:
+                    current_session.total_exits += event.get('people_count', 1)
+                    today_count.total_exits += event.get('people_count', 1)
+                    logger.info(f"⬅️ Auto-saved EXIT event #{event_idx + 1}")
+                
+                # Attempt to commit this individual event
                 try:
                     db.session.commit()
-                    logger.info(f"✅ Created session {current_session.id}")
-                except Exception as e:
-                    logger.error(f"❌ Failed to create session: {e}")
+                    occupancy_series.record(event.get('timestamp') or datetime.now(),
+                                            max(0, today_count.total_entries - today_count.total_exits))
+                    saved_events.append({
+                        'direction': event['direction'],
+                        'people_count': event.get('people_count', 1),
+                        'timestamp': count_event.timestamp.isoformat(),
+                        'event_id': count_event.id
+                    })
+                    logger.info(f"💾 Event {count_event.id} committed to database")
+                except Exception as commit_error:
+                    logger.error(f"❌ Commit failed for event {event_idx + 1}: {commit_error}")
                     db.session.rollback()
-                    return jsonify({'status': 'error', 'message': f'Failed to create session: {e}'})
-            
-            # Get today's daily count (create if needed)
-            today_count = get_or_create_daily_count()
-            
-            saved_events = []
-            failed_events = []
-            
-            for event_idx, event in enumerate(events):
-                try:
-                    # Create count event record with automatic retry
-                    count_event = CountEvent(
-                        session_id=current_session.id,
-                        direction=Direction.IN if event['direction'] == 'IN' else Direction.OUT,
-                        people_count=event.get('people_count', 1),
-                        detection_confidence=event.get('confidence', 0.0)
-                    )
-                    db.session.add(count_event)
-                    
-                    # Update session totals automatically
-                    if event['direction'] == 'IN':
-                        current_session.total_entries += event.get('people_count', 1)
-                        today_count.total_entries += event.get('people_count', 1)
-                        logger.info(f"➡️ Auto-saved ENTRY event #{event_idx + 1}")
-                    else:
-                        current_session.total_exits += event.get('people_count', 1)
-                        today_count.total_exits += event.get('people_count', 1)
-                        logger.info(f"⬅️ Auto-saved EXIT event #{event_idx + 1}")
-                    
-                    # Attempt to commit this individual event
-                    try:
-                        db.session.commit()
-                        saved_events.append({
-                            'direction': event['direction'],
-                            'people_count': event.get('people_count', 1),
-                            'timestamp': count_event.timestamp.isoformat(),
-                            'event_id': count_event.id
-                        })
-                        logger.info(f"💾 Event {count_event.id} committed to database")
-                    except Exception as commit_error:
-                        logger.error(f"❌ Commit failed for event {event_idx + 1}: {commit_error}")
-                        db.session.rollback()
-                        failed_events.append(event)
-                        continue
-                    
-                except Exception as e:
-                    logger.error(f"❌ Failed to process event {event_idx + 1}: {e}")
                     failed_events.append(event)
-                    db.session.rollback()
                     continue
             
-            # Update current occupancy automatically
-            try:
-                current_occupancy = max(0, today_count.total_entries - today_count.total_exits)
-                today_count.current_occupancy = current_occupancy
-                
-                # Update peak occupancy if needed
-                if current_occupancy > today_count.peak_occupancy:
-                    today_count.peak_occupancy = current_occupancy
-                    logger.info(f"📈 New peak occupancy: {current_occupancy}")
-                
-                db.session.commit()
-                logger.info(f"📊 Updated occupancy: {current_occupancy} people")
-                
             except Exception as e:
-                logger.error(f"❌ Failed to update occupancy: {e}")
+                logger.error(f"❌ Failed to process event {event_idx + 1}: {e}")
+                failed_events.append(event)
                 db.session.rollback()
+                continue
+        
+        # Update current occupancy automatically
+        try:
+            current_occupancy = max(0, today_count.total_entries - today_count.total_exits)
+            today_count.current_occupancy = current_occupancy
             
-            # Prepare response
-            response_data = {
-                'status': 'success',
-                'message': f'Auto-saved {len(saved_events)}/{len(events)} count events',
-                'events': saved_events,
-                'current_occupancy': current_occupancy if 'current_occupancy' in locals() else 0,
-                'session_id': current_session.id,
-                'total_entries_today': today_count.total_entries,
-                'total_exits_today': today_count.total_exits
-            }
-            
-            if failed_events:
-                response_data['warning'] = f'{len(failed_events)} events failed to save'
-                response_data['failed_count'] = len(failed_events)
-                logger.warning(f"⚠️ {len(failed_events)} events failed to save")
+            # Update peak occupancy if needed
+            if current_occupancy > today_count.peak_occupancy:
+                today_count.peak_occupancy = current_occupancy
+                logger.info(f"📈 New peak occupancy: {current_occupancy}")
             
-            logger.info(f"✅ Auto-save complete: {len(saved_events)} events saved")
+            db.session.commit()
+            logger.info(f"📊 Updated occupancy: {current_occupancy} people")
+        
+        except Exception as e:
+            logger.error(f"❌ Failed to update occupancy: {e}")
+            db.session.rollback()
+        
+        # Prepare response
+        response_data = {
+            'status': 'success',
+            'message': f'Auto-saved {len(saved_events)}/{len(events)} count events',
+            'events': saved_events,
+            'current_occupancy': current_occupancy if 'current_occupancy' in locals() else 0,
+            'session_id': current_session.id,
+            'total_entries_today': today_count.total_entries,
+            'total_exits_today': today_count.total_exits
+        }
+        
+        if failed_events:
+            response_data['warning'] = f'{len(failed_events)} events failed to save'
+            response_data['failed_count'] = len(failed_events)
+            logger.warning(f"⚠️ {len(failed_events)} events failed to save")
+        
+        logger.info(f"✅ Auto-save complete: {len(saved_events)} events saved")
+        return response_data
+
+@app.route('/check_count_events')
+def check_count_events():
+    """Check for new count events and save to database with enhanced reliability"""
+    global people_counter_camera
+    
+    if people_counter_camera is None:
+        logger.warning("Check count events called but camera not initialized")
+        return jsonify({'status': 'error', 'message': 'Camera not initialized'})
+    
+    try:
+        response_data = save_pending_events(people_counter_camera)
+        if response_data:
             return jsonify(response_data)
         else:
             # No events - this is normal, just return status
@@ -324,12 +491,93 @@ def check_count_events():
             'auto_save': 'failed'
         })
 
+def events_cursor(event_buffer, since):
+    """Check an /api/events cursor, returning (since, reset).
+    
+    A cursor ahead of the buffer means the server restarted, so the client starts over.
+    """
+    if since > event_buffer.latest_seq:
+        return 0, True
+    return since, False
+
+def save_returned_events(camera, items):
+    """Make sure events returned by /api/events are saved, even if no one calls /check_count_events"""
+    if items:
+        save_pending_events(camera)
+
+def build_events_response(items, since, reset):
+    """Serialize (seq, event) pairs from the event buffer for /api/events"""
+    events_data = []
+    for seq, event in items:
+        events_data.append({
+            'seq': seq,
+            'direction': event['direction'],
+            'people_count': event.get('people_count', 1),
+            'confidence': event.get('confidence', 0.0),
+            'timestamp': event['timestamp'].isoformat()
+        })
+    
+    return {
+        'status': 'success',
+        'events': events_data,
+        'cursor': items[-1][0] if items else since,
+        'reset': reset
+    }
+
+@app.route('/api/events')
+def api_events():
+    """Incremental, non-destructive event feed: /api/events?since=<seq>&timeout=<seconds>"""
+    global people_counter_camera
+    
+    if people_counter_camera is None:
+        return jsonify({'status': 'error', 'message': 'Camera not initialized'})
+    
+    since = request.args.get('since', 0, type=int)
+    timeout = min(max(request.args.get('timeout', 0.0, type=float), 0.0), MAX_LONG_POLL_SECONDS)
+    
+    try:
+        event_buffer = people_counter_camera.count_events
+        since, reset = events_cursor(event_buffer, since)
+        
+        # Long-poll until something newer than the client's cursor arrives
+        items = event_buffer.wait_since(since, timeout)
+        save_returned_events(people_counter_camera, items)
+        
+        return jsonify(build_events_response(items, since, reset))
+    except Exception as e:
+        logger.error(f"Error in events feed: {e}")
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)})
+
+def start_event_saver(interval=0.5):
+    """Save count events in the background so counting does not depend on an open browser tab"""
+    def run():
+        while True:
+            time.sleep(interval)
+            # Daily counts start again at midnight; make the occupancy chart follow
+            if occupancy_series.start_day(datetime.combine(date.today(), datetime.min.time())):
+                logger.info("🌙 New day: occupancy series reset to 0")
+            if people_counter_camera is None:
+                continue
+            with app.app_context():
+                try:
+                    save_pending_events(people_counter_camera)
+                except Exception as e:
+                    logger.error(f"❌ Background event save failed: {e}")
+                    db.session.rollback()
+            occupancy_series.save_if_due()
+    
+    saver = Thread(target=run, name='event-saver', daemon=True)
+    saver.start()
+    logger.info("✅ Background event saver started")
+    return saver
+
 @app.route('/auto_save_status')
 def auto_save_status():
     """Check auto-save system status"""
     try:
         # Test database connection
-        db.session.execute('SELECT 1')
+        db.session.execute(text('SELECT 1'))
         db_status = 'connected'
         
         # Check current session
@@ -343,6 +591,7 @@ def auto_save_status():
         # Check camera status
         global people_counter_camera
         camera_status = 'active' if people_counter_camera is not None else 'inactive'
+        event_buffers = people_counter_camera.get_event_buffer_stats() if people_counter_camera else None
         
         return jsonify({
             'status': 'success',
@@ -353,7 +602,10 @@ def auto_save_status():
             'camera': camera_status,
             'session_id': current_session.id if current_session else None,
             'entries_today': today_count.total_entries if today_count else 0,
-            'exits_today': today_count.total_exits if today_count else 0
+            'exits_today': today_count.total_exits if today_count else 0,
+            'event_buffers': event_buffers,
+            'inference': people_counter_camera.get_inference_stats() if people_counter_camera else None,
+            'aggregation': edge_pusher.stats() if edge_pusher else None
         })
         
     except Exception as e:
@@ -364,12 +616,39 @@ def auto_save_status():
             'message': str(e)
         })
 
+def migrate_database():
+    """Add columns and indexes introduced after an existing database was created"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('count_event')}
+    with db.engine.begin() as connection:
+        if 'event_uid' not in columns:
+            connection.execute(text('ALTER TABLE count_event ADD COLUMN event_uid VARCHAR(32)'))
+            logger.info("✅ Added count_event.event_uid column")
+        # create_all only creates indexes together with their table
+        connection.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_count_event_event_uid ON count_event (event_uid)'))
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_count_event_timestamp ON count_event (timestamp)'))
+        connection.execute(text('CREATE INDEX IF NOT EXISTS ix_count_event_session_id ON count_event (session_id)'))
+        
+        # Without AUTOINCREMENT SQLite hands out the IDs of deleted events again; the table
+        # can only gain it by being rebuilt
+        table_sql = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'count_event'")).scalar()
+        if 'AUTOINCREMENT' not in table_sql.upper():
+            columns = ', '.join(column.name for column in CountEvent.__table__.columns)
+            connection.execute(text('ALTER TABLE count_event RENAME TO count_event_old'))
+            for index in CountEvent.__table__.indexes:
+                connection.execute(text(f'DROP INDEX IF EXISTS {index.name}'))
+            CountEvent.__table__.create(connection)
+            connection.execute(text(f'INSERT INTO count_event ({columns}) SELECT {columns} FROM count_event_old'))
+            connection.execute(text('DROP TABLE count_event_old'))
+            logger.info("✅ Rebuilt count_event with never-reused event IDs")
+
 def ensure_database_ready():
     """Ensure database is ready for auto-saving"""
     try:
         # Create tables if they don't exist
         with app.app_context():
             db.create_all()
+            migrate_database()
             logger.info("✅ Database tables verified/created")
         
         # Ensure we have a daily count for today
@@ -419,6 +698,14 @@ def end_session():
 @app.route('/api/stats')
 def api_stats():
     """API endpoint for real-time statistics"""
+    # Answer unchanged polls from the version counter alone, without touching the database
+    etag = f'{date.today().isoformat()}-{stats_etag_token}-{stats_version}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
     try:
         # Get today's counts
         today_count = get_or_create_daily_count()
@@ -440,7 +727,7 @@ def api_stats():
                 'confidence': event.detection_confidence
             })
         
-        return jsonify({
+        response = jsonify({
             'status': 'success',
             'current_occupancy': current_occupancy,
             'today_entries': today_count.total_entries,
@@ -450,10 +737,26 @@ def api_stats():
             'session_exits': current_session.total_exits if current_session else 0,
             'recent_events': events_data
         })
+        response.set_etag(etag)
+        # Let browsers cache the body but revalidate with If-None-Match on every poll
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return jsonify({'status': 'error', 'message': str(e)})
 
+@app.route('/api/occupancy/series')
+def api_occupancy_series():
+    """Occupancy chart data: /api/occupancy/series?resolution=second|minute|quarter&points=<n>"""
+    resolution = request.args.get('resolution', 'minute')
+    if resolution not in RESOLUTIONS:
+        return jsonify({'status': 'error', 'message': f"resolution must be one of {', '.join(RESOLUTIONS)}"}), 400
+    
+    # Built from the in-memory series only, so the cost depends on points, not on history size
+    data = occupancy_series.series(resolution, request.args.get('points', type=int))
+    data['status'] = 'success'
+    return jsonify(data)
+
 @app.route('/stats')
 def stats():
     """Statistics dashboard"""
@@ -484,9 +787,34 @@ def stats():
                              total_entries=0,
                              total_exits=0)
 
+def local_to_utc(value):
+    """Convert a naive local datetime to the naive UTC used for stored timestamps"""
+    return datetime.utcfromtimestamp(value.timestamp())
+
+def sum_event_totals(*criteria):
+    """Total (entries, exits) of saved events matching the given filters, by aggregate query"""
+    rows = db.session.query(CountEvent.direction, func.sum(CountEvent.people_count)) \
+        .filter(*criteria).group_by(CountEvent.direction).all()
+    totals = dict(rows)
+    return totals.get(Direction.IN) or 0, totals.get(Direction.OUT) or 0
+
+def recompute_totals(count_session, days):
+    """Recompute session and daily totals from the saved events instead of adding to them"""
+    count_session.total_entries, count_session.total_exits = sum_event_totals(CountEvent.session_id == count_session.id)
+    
+    for day in days:
+        day_start = datetime.combine(day, datetime.min.time())
+        daily_count = get_or_create_daily_count(day)
+        daily_count.total_entries, daily_count.total_exits = sum_event_totals(
+            CountEvent.timestamp >= local_to_utc(day_start),
+            CountEvent.timestamp < local_to_utc(day_start + timedelta(days=1))
+        )
+        daily_count.current_occupancy = max(0, daily_count.total_entries - daily_count.total_exits)
+        daily_count.peak_occupancy = max(daily_count.peak_occupancy, daily_count.current_occupancy)
+
 @app.route('/backup_recovery', methods=['POST'])
 def backup_recovery():
-    """Recover count events from backup storage"""
+    """Recover count events from backup storage, skipping any that were already saved"""
     global people_counter_camera
     
     if people_counter_camera is None:
@@ -499,51 +827,57 @@ def backup_recovery():
         
         logger.info(f"🔄 Attempting to recover {len(backup_events)} backup events")
         
-        # Ensure we have session and daily count
-        current_session = CountSession.query.filter_by(end_time=None).first()
-        if not current_session:
-            current_session = CountSession()
-            db.session.add(current_session)
+        # Hold off the event saver so it cannot save the same events in the meantime
+        with event_save_lock:
+            # Ensure we have a session
+            current_session = CountSession.query.filter_by(end_time=None).first()
+            if not current_session:
+                current_session = CountSession()
+                db.session.add(current_session)
+                db.session.commit()
+            
+            # One indexed lookup for the IDs the database already has
+            event_ids = [event['event_id'] for event in backup_events if event.get('event_id')]
+            saved_ids = {uid for (uid,) in db.session.query(CountEvent.event_uid)
+                         .filter(CountEvent.event_uid.in_(event_ids))}
+            
+            rows = []
+            days = {date.today()}
+            for event in backup_events:
+                if event.get('event_id') in saved_ids:
+                    continue
+                timestamp = event.get('timestamp', datetime.now())
+                rows.append({
+                    'session_id': current_session.id,
+                    'event_uid': event.get('event_id') or uuid.uuid4().hex,
+                    'direction': Direction.IN if event['direction'] == 'IN' else Direction.OUT,
+                    'people_count': event.get('people_count', 1),
+                    'detection_confidence': event.get('confidence', 0.0),
+                    # Stored in UTC like events saved by save_pending_events
+                    'timestamp': local_to_utc(timestamp)
+                })
+                days.add(timestamp.date())
+            
+            # Single bulk insert; a conflicting ID means the event is already saved
+            if rows:
+                db.session.execute(sqlite_insert(CountEvent).on_conflict_do_nothing(index_elements=['event_uid']), rows)
+            
+            recompute_totals(current_session, sorted(days))
             db.session.commit()
-        
-        today_count = get_or_create_daily_count()
-        
-        recovered_count = 0
-        for event in backup_events:
-            try:
-                count_event = CountEvent(
-                    session_id=current_session.id,
-                    direction=Direction.IN if event['direction'] == 'IN' else Direction.OUT,
-                    people_count=event.get('people_count', 1),
-                    detection_confidence=event.get('confidence', 0.0),
-                    timestamp=event.get('timestamp', datetime.utcnow())
-                )
-                db.session.add(count_event)
-                
-                # Update totals
-                if event['direction'] == 'IN':
-                    current_session.total_entries += event.get('people_count', 1)
-                    today_count.total_entries += event.get('people_count', 1)
-                else:
-                    current_session.total_exits += event.get('people_count', 1)
-                    today_count.total_exits += event.get('people_count', 1)
-                
-                recovered_count += 1
-                
-            except Exception as e:
-                logger.error(f"Failed to recover backup event: {e}")
-                continue
-        
-        db.session.commit()
+            
+            today_count = get_or_create_daily_count()
+            occupancy_series.record(datetime.now(), today_count.current_occupancy)
         
         # Clear backup after successful recovery
         people_counter_camera.clear_backup_events()
         
-        logger.info(f"✅ Successfully recovered {recovered_count} events from backup")
+        skipped_count = len(backup_events) - len(rows)
+        logger.info(f"✅ Recovered {len(rows)} events from backup, {skipped_count} were already saved")
         return jsonify({
             'status': 'success',
-            'message': f'Recovered {recovered_count} events from backup',
-            'recovered_count': recovered_count
+            'message': f'Recovered {len(rows)} events from backup ({skipped_count} already saved)',
+            'recovered_count': len(rows),
+            'skipped_count': skipped_count
         })
         
     except Exception as e:
@@ -551,6 +885,141 @@ def backup_recovery():
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)})
 
+def aggregation_authorized():
+    """Check the shared aggregation token, if one is configured"""
+    token = app.config['AGGREGATION_TOKEN']
+    return not token or request.headers.get('X-Aggregation-Token') == token
+
+def event_local_date(timestamp):
+    """Local date of a pushed ISO timestamp; naive ones are UTC, like stored event timestamps"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone().date()
+
+@app.route('/api/aggregate/ingest', methods=['POST'])
+def aggregate_ingest():
+    """Ingest a batch of events pushed by an edge node; idempotent per node sequence number"""
+    if not aggregation_authorized():
+        return jsonify({'status': 'error', 'message': 'Invalid aggregation token'}), 403
+    
+    try:
+        body = request.get_data()
+        if request.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        payload = json.loads(body)
+        node_id = str(payload['node_id'])
+        
+        with aggregate_lock:
+            node = NodeState.query.filter_by(node_id=node_id).first()
+            if not node:
+                node = NodeState(node_id=node_id, last_seq=0)
+                db.session.add(node)
+                logger.info(f"📡 New edge node registered: {node_id}")
+            node.building = payload.get('building') or node.building or 'main'
+            node.floor = payload.get('floor') or node.floor or '1'
+            
+            # Sum the new events per local day, the days /api/aggregate/occupancy reports;
+            # anything at or below the cursor was already ingested
+            daily_totals = {}
+            accepted = 0
+            for seq, timestamp, direction, people_count in sorted(payload['events']):
+                if seq <= node.last_seq:
+                    continue
+                totals = daily_totals.setdefault(event_local_date(timestamp), [0, 0])
+                totals[0 if direction == 'IN' else 1] += people_count
+                node.last_seq = seq
+                accepted += 1
+            
+            for day, (entries, exits) in daily_totals.items():
+                daily_count = NodeDailyCount.query.filter_by(node_id=node_id, date=day).first()
+                if not daily_count:
+                    daily_count = NodeDailyCount(node_id=node_id, date=day, total_entries=0, total_exits=0)
+                    db.session.add(daily_count)
+                daily_count.total_entries += entries
+                daily_count.total_exits += exits
+            
+            node.last_seen = datetime.utcnow()
+            db.session.commit()
+        
+        if accepted:
+            logger.info(f"📥 Ingested {accepted}/{len(payload['events'])} events from {node_id} (seq {node.last_seq})")
+        return jsonify({'status': 'success', 'accepted': accepted, 'last_seq': node.last_seq})
+    
+    except Exception as e:
+        logger.error(f"Aggregate ingest failed: {e}")
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+@app.route('/api/aggregate/nodes/<node_id>')
+def aggregate_node(node_id):
+    """Ingestion cursor for one edge node, used by the node to resume pushing"""
+    if not aggregation_authorized():
+        return jsonify({'status': 'error', 'message': 'Invalid aggregation token'}), 403
+    
+    node = NodeState.query.filter_by(node_id=node_id).first()
+    return jsonify({
+        'status': 'success',
+        'node_id': node_id,
+        'last_seq': node.last_seq if node else 0,
+        'last_seen': node.last_seen.isoformat() if node else None
+    })
+
+@app.route('/api/aggregate/occupancy')
+def aggregate_occupancy():
+    """Building and floor occupancy across all edge nodes: /api/aggregate/occupancy?date=YYYY-MM-DD"""
+    try:
+        target_date = date.fromisoformat(request.args['date']) if 'date' in request.args else date.today()
+        
+        rows = db.session.query(
+            NodeState.building,
+            NodeState.floor,
+            func.count(NodeState.id),
+            func.sum(NodeDailyCount.total_entries),
+            func.sum(NodeDailyCount.total_exits)
+        ).join(NodeDailyCount, NodeDailyCount.node_id == NodeState.node_id) \
+         .filter(NodeDailyCount.date == target_date) \
+         .group_by(NodeState.building, NodeState.floor).all()
+        
+        buildings = {}
+        for building, floor, node_count, entries, exits in rows:
+            summary = buildings.setdefault(building, {'entries': 0, 'exits': 0, 'floors': {}})
+            summary['entries'] += entries
+            summary['exits'] += exits
+            summary['floors'][floor] = {
+                'nodes': node_count,
+                'entries': entries,
+                'exits': exits,
+                'occupancy': max(0, entries - exits)
+            }
+        for summary in buildings.values():
+            summary['occupancy'] = max(0, summary['entries'] - summary['exits'])
+        
+        return jsonify({'status': 'success', 'date': target_date.isoformat(), 'buildings': buildings})
+    except Exception as e:
+        logger.error(f"Error computing aggregate occupancy: {e}")
+        return jsonify({'status': 'error', 'message': str(e)})
+
+def fetch_saved_events(after_seq, limit):
+    """Saved events with IDs above after_seq, oldest first, for the edge pusher"""
+    with app.app_context():
+        rows = db.session.query(CountEvent.id, CountEvent.timestamp, CountEvent.direction, CountEvent.people_count) \
+            .filter(CountEvent.id > after_seq).order_by(CountEvent.id).limit(limit).all()
+        # Stored timestamps are naive UTC; mark them so the aggregator can place them on its local day
+        return [(row.id, row.timestamp.replace(tzinfo=timezone.utc), row.direction.value, row.people_count)
+                for row in rows]
+
+def start_edge_pusher():
+    """Start pushing saved events to the configured aggregator, if any"""
+    global edge_pusher
+    if not app.config['AGGREGATOR_URL'] or edge_pusher is not None:
+        return edge_pusher
+    
+    edge_pusher = EdgePusher(app.config['AGGREGATOR_URL'], app.config['NODE_ID'], fetch_saved_events,
+                             building=app.config['NODE_BUILDING'], floor=app.config['NODE_FLOOR'],
+                             token=app.config['AGGREGATION_TOKEN']).start()
+    return edge_pusher
+
 @app.route('/reset_counts', methods=['POST'])
 def reset_counts():
     """Reset all counts (for testing/maintenance)"""
@@ -565,6 +1034,7 @@ def reset_counts():
         CountSession.query.delete()
         DailyCount.query.delete()
         db.session.commit()
+        occupancy_series.clear()
         
         # Also clear backup events
         global people_counter_camera
@@ -590,4 +1060,14 @@ if __name__ == '__main__':
         else:
             print("❌ Auto-save system initialization failed")
     
-    app.run(debug=True, threaded=True) 
+    start_event_saver()
+    start_edge_pusher()
+    
+    if app.config['HEADLESS']:
+        # Start counting immediately; no viewer is needed to drive the pipeline
+        people_counter_camera = create_camera()
+        people_counter_camera.start()
+        print("✅ Headless counting pipeline started")
+    
+    # The reloader would start a second process that opens the camera again
+    app.run(debug=True, threaded=True, use_reloader=False, port=int(os.environ.get('PORT', '5000'))) 
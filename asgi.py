@@ -0,0 +1,349 @@
+"""Production entry point serving the people counter under an ASGI server.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+
+The streaming endpoints (/video_feed, /detections_feed and /api/events) are served by
+async handlers that await frames and events from the camera pipeline, so each viewer
+costs a coroutine instead of an OS thread. Every other route is the regular Flask app,
+run in a small thread pool.
+"""
+import asyncio
+import json
+import logging
+import os
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import app as counter_app
+from app import (app, db, create_camera, ensure_database_ready, start_event_saver, start_edge_pusher,
+                 events_cursor, save_returned_events, build_events_response, stream_fps)
+from camera_controller import StreamEncoder
+
+logger = logging.getLogger(__name__)
+
+# Thread pool size for regular (non-streaming) Flask routes
+WSGI_WORKERS = int(os.environ.get('PEOPLE_COUNTER_WSGI_WORKERS', '10'))
+
+# Output widths a stream may ask for; requests are rounded up to the next one so clients
+# cannot create an encoder (and its buffers) per arbitrary width
+STREAM_WIDTHS = (160, 320, 480, 640, 960, 1280, 1920)
+
+class AsyncNotifier:
+    """Wake coroutines waiting on an event loop when a thread signals new data"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.future = loop.create_future()
+
+    def notify(self, *args):
+        """Signal waiters; safe to call from any thread"""
+        self.loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        if not self.future.done():
+            self.future.set_result(None)
+        self.future = self.loop.create_future()
+
+    async def wait(self, timeout=None):
+        """Wait for the next notification, or until timeout seconds pass"""
+        # asyncio.wait never cancels the shared future and, unlike wait_for, never swallows a
+        # cancellation that lands as the future completes, so disconnected viewers stop
+        await asyncio.wait({self.future}, timeout=timeout)
+
+class SharedFrameEncoder:
+    """Encode each frame once per output variant and share the JPEG between all viewers"""
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.encoders = {}  # variant -> StreamEncoder pinned to one ladder level
+        self.locks = {}
+        self.cache = {}     # variant -> (seq, JPEG bytes)
+        self.viewers = {}   # (width, quality, overlay) -> connected viewers
+
+    def add_viewer(self, width, quality, overlay):
+        key = (width, quality, overlay)
+        self.viewers[key] = self.viewers.get(key, 0) + 1
+
+    def remove_viewer(self, width, quality, overlay):
+        """Forget a viewer, dropping the encoders and cached frames nobody else uses"""
+        key = (width, quality, overlay)
+        self.viewers[key] -= 1
+        if self.viewers[key] > 0:
+            return
+        del self.viewers[key]
+        for variant in [variant for variant in self.encoders if variant[:3] == key]:
+            self.encoders.pop(variant, None)
+            self.locks.pop(variant, None)
+            self.cache.pop(variant, None)
+
+    def render_latest(self, encoder, overlay):
+        """Encode the latest frame, keeping capture out of its buffer until done; returns (seq, JPEG)"""
+        with self.camera.pinned_frame() as (seq, frame, detections, tracks):
+            return seq, self.camera.render_jpeg(encoder, frame, detections, tracks, overlay)
+
+    async def get(self, seq, width, quality, overlay, level):
+        """Return JPEG bytes for frame seq or newer, encoding in a worker thread on a cache miss"""
+        variant = (width, quality, overlay, level)
+        lock = self.locks.setdefault(variant, asyncio.Lock())
+
+        async with lock:
+            cached = self.cache.get(variant)
+            if cached and cached[0] >= seq:
+                return cached[1]
+
+            encoder = self.encoders.get(variant)
+            if encoder is None:
+                encoder = StreamEncoder(width=width, quality=quality)
+                encoder.level = level
+                self.encoders[variant] = encoder
+
+            # The frame is pinned in the worker thread, so a render queued behind other work
+            # encodes whatever is latest then instead of a buffer capture may be reusing
+            loop = asyncio.get_running_loop()
+            rendered_seq, jpeg = await loop.run_in_executor(None, self.render_latest, encoder, overlay)
+            self.cache[variant] = (rendered_seq, jpeg)
+            return jpeg
+
+# Set up on lifespan startup
+camera = None
+frame_notifier = None
+event_notifier = None
+shared_encoder = None
+
+def query_params(scope):
+    """Parse the query string of an ASGI scope into a dict of single values"""
+    params = parse_qs(scope.get('query_string', b'').decode())
+    return {key: values[-1] for key, values in params.items()}
+
+def snap_width(width):
+    """Round a requested output width up to one of STREAM_WIDTHS (None keeps the capture width)"""
+    if not width or width <= 0:
+        return None
+    return next((w for w in STREAM_WIDTHS if w >= width), STREAM_WIDTHS[-1])
+
+def param(params, name, cast, default=None):
+    """Read a typed query parameter, falling back to default when missing or invalid"""
+    try:
+        return cast(params[name])
+    except (KeyError, ValueError):
+        return default
+
+async def run_until_disconnect(receive, body):
+    """Run a streaming body coroutine, cancelling it when the client disconnects"""
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    body_task = asyncio.ensure_future(body)
+    watcher = asyncio.ensure_future(watch_disconnect())
+    done, pending = await asyncio.wait({body_task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    # Let cancelled tasks unwind before the caller cleans up after this viewer
+    await asyncio.gather(*pending, return_exceptions=True)
+    if body_task in done:
+        body_task.result()
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def video_feed(scope, receive, send):
+    """MJPEG stream; frames are shared between viewers with the same output settings"""
+    params = query_params(scope)
+    width = snap_width(param(params, 'width', int))
+    quality = param(params, 'quality', int)
+    if quality is not None:
+        # Steps of 5 keep the number of shared variants small
+        quality = min(max(round(quality / 5) * 5, 10), 95)
+    max_fps = stream_fps(param(params, 'fps', float))
+    overlay = params.get('overlay', '0' if app.config['HEADLESS'] else '1') == '1'
+
+    # Per-viewer pacing and ladder state; the encoding itself is shared
+    encoder = StreamEncoder(width=width, quality=quality, max_fps=max_fps)
+    loop = asyncio.get_running_loop()
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'multipart/x-mixed-replace; boundary=frame'),
+                    (b'cache-control', b'no-cache')]
+    })
+
+    async def stream():
+        last_seq = 0
+        while True:
+            seq = camera.peek_frame()[0]
+            if seq <= last_seq:
+                await frame_notifier.wait(1.0)
+                continue
+
+            now = loop.time()
+            if not encoder.should_send(now):
+                await asyncio.sleep(encoder.frame_interval - (now - encoder.last_sent))
+                continue
+            last_seq = seq
+
+            jpeg = await shared_encoder.get(seq, width, quality, overlay, encoder.level)
+            if not jpeg:
+                continue
+
+            # send() waits for the transport to drain, so its duration reflects client backpressure
+            send_start = loop.time()
+            await send({
+                'type': 'http.response.body',
+                'body': b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n',
+                'more_body': True
+            })
+            now = loop.time()
+            encoder.record_send(now, now - send_start)
+
+    shared_encoder.add_viewer(width, quality, overlay)
+    try:
+        await run_until_disconnect(receive, stream())
+    finally:
+        shared_encoder.remove_viewer(width, quality, overlay)
+
+async def detections_feed(scope, receive, send):
+    """Server-sent event stream of per-frame boxes and track IDs"""
+    params = query_params(scope)
+    max_fps = stream_fps(param(params, 'fps', float))
+    frame_interval = 1.0 / max_fps if max_fps else 0.0
+    loop = asyncio.get_running_loop()
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache')]
+    })
+
+    async def stream():
+        last_seq = 0
+        last_sent = 0.0
+        while True:
+            seq, frame, detections, tracks = camera.peek_frame()
+            if seq <= last_seq:
+                await frame_notifier.wait(1.0)
+                if camera.peek_frame()[0] <= last_seq:
+                    # Keep-alive comment so proxies do not close an idle stream
+                    await send({'type': 'http.response.body', 'body': b': keep-alive\n\n', 'more_body': True})
+                continue
+
+            now = loop.time()
+            if now - last_sent < frame_interval:
+                await asyncio.sleep(frame_interval - (now - last_sent))
+                continue
+            last_seq = seq
+            last_sent = now
+
+            payload = camera.detections_payload(seq, frame, detections, tracks)
+            body = f"data: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    await run_until_disconnect(receive, stream())
+
+def save_returned_events_in_app_context(items):
+    with app.app_context():
+        try:
+            save_returned_events(camera, items)
+        except Exception as e:
+            logger.error(f"❌ Failed to save events: {e}")
+            db.session.rollback()
+
+async def api_events(scope, receive, send):
+    """Async long-poll version of /api/events"""
+    params = query_params(scope)
+    since = param(params, 'since', int, 0)
+    timeout = min(max(param(params, 'timeout', float, 0.0), 0.0), counter_app.MAX_LONG_POLL_SECONDS)
+    loop = asyncio.get_running_loop()
+    event_buffer = camera.count_events
+    since, reset = events_cursor(event_buffer, since)
+
+    deadline = loop.time() + timeout
+    items = event_buffer.read_since(since)
+    while not items:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await event_notifier.wait(remaining)
+        items = event_buffer.read_since(since)
+
+    if items:
+        await loop.run_in_executor(None, save_returned_events_in_app_context, items)
+
+    await send_json(send, build_events_response(items, since, reset))
+
+STREAMING_ROUTES = {
+    '/video_feed': video_feed,
+    '/detections_feed': detections_feed,
+    '/api/events': api_events,
+}
+
+wsgi_app = WSGIMiddleware(app, workers=WSGI_WORKERS)
+
+async def startup():
+    """Prepare the database and start the camera pipeline once per process"""
+    global camera, frame_notifier, event_notifier, shared_encoder
+    loop = asyncio.get_running_loop()
+
+    def prepare_database():
+        with app.app_context():
+            db.create_all()
+            return ensure_database_ready()
+
+    if await loop.run_in_executor(None, prepare_database):
+        logger.info("✅ Auto-save system initialized")
+    else:
+        logger.error("❌ Auto-save system initialization failed")
+
+    camera = create_camera()
+    counter_app.people_counter_camera = camera
+
+    frame_notifier = AsyncNotifier(loop)
+    event_notifier = AsyncNotifier(loop)
+    camera.add_frame_listener(frame_notifier.notify)
+    camera.count_events.add_listener(event_notifier.notify)
+    shared_encoder = SharedFrameEncoder(camera)
+
+    camera.start()
+    start_event_saver()
+    start_edge_pusher()
+    logger.info("✅ Async people counter server ready")
+
+async def application(scope, receive, send):
+    """ASGI application: async streaming routes, everything else through Flask"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await startup()
+                    await send({'type': 'lifespan.startup.complete'})
+                except Exception as e:
+                    logger.error(f"❌ Startup failed: {e}", exc_info=True)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+            elif message['type'] == 'lifespan.shutdown':
+                if camera is not None:
+                    camera.stop()
+                counter_app.occupancy_series.save()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    handler = STREAMING_ROUTES.get(scope.get('path')) if scope['type'] == 'http' else None
+    if handler is not None and camera is not None:
+        await handler(scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(application, host=os.environ.get('HOST', '0.0.0.0'), port=int(os.environ.get('PORT', '8000')))
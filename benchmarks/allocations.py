@@ -0,0 +1,142 @@
+"""Benchmark: memory allocated per frame by capture, preprocessing, encoding and tracking.
+
+Every step runs over synthetic frames under tracemalloc and is reported per frame as
+  blocks  allocations still alive when the step returns (snapshot statistics('lineno')
+          count differences), including whatever the step hands back to its caller
+  KiB     memory allocated above the steady state at the step's peak, temporaries included
+
+The original per-frame code (a new capture buffer from cap.read(), cv2.flip, then
+blobFromImage(cv2.resize(...)), resize and imencode) is compared with the pooled path
+(PeopleCounterCamera.read_frame, BlobPreprocessor and render_jpeg with a StreamEncoder).
+Both encode at the same output width and JPEG quality. Detection post-processing and
+tracking are measured with a stub network that reports a fixed number of people, so their
+cost per person is visible. No camera or model is needed.
+
+Only allocations made through Python and numpy are traced. Scratch memory OpenCV allocates
+internally is invisible, but arrays it returns are counted.
+
+    python benchmarks/allocations.py --frames 200 --width 1280 --height 720 --output-widths 1280,640
+"""
+import argparse
+import logging
+import os
+import sys
+import tracemalloc
+from collections import Counter
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera_controller import StreamEncoder
+from stubs import StubCapture, make_camera
+
+# Snapshots are themselves allocated while tracing; they are not the pipeline's
+IGNORED = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+def measure(step, frames, warmup=10):
+    """Return (blocks, bytes) per frame, and a Counter of blocks by source line.
+
+    Peaks and snapshots are taken in separate passes so neither disturbs the other.
+    """
+    for frame in frames[:warmup]:
+        step(frame)
+    measured = frames[warmup:]
+
+    tracemalloc.start()
+    peaks = []
+    for frame in measured:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        step(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - current)
+
+    # The first filter compiles and caches its pattern; keep that out of the first frame
+    tracemalloc.take_snapshot().filter_traces(IGNORED)
+    lines = Counter()
+    for frame in measured:
+        before = tracemalloc.take_snapshot().filter_traces(IGNORED)
+        result = step(frame)
+        after = tracemalloc.take_snapshot().filter_traces(IGNORED)
+        del result
+        for stat in after.compare_to(before, 'lineno'):
+            if stat.count_diff > 0:
+                lines[str(stat.traceback[0])] += stat.count_diff
+    tracemalloc.stop()
+
+    return sum(lines.values()) / len(measured), sum(peaks) / len(measured), lines
+
+def baseline_preprocess(frame):
+    """Original: flip the frame, then resize into a new blob"""
+    frame = cv2.flip(frame, 1)
+    return frame, cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 0.007843, (300, 300), 127.5)
+
+def make_baseline_encode(width, quality):
+    def step(flipped):
+        """Original imencode of the flipped frame, resized to the same output width"""
+        height = int(flipped.shape[0] * width / flipped.shape[1])
+        if width != flipped.shape[1]:
+            flipped = cv2.resize(flipped, (width, height), interpolation=cv2.INTER_AREA)
+        ret, buffer = cv2.imencode('.jpg', flipped, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes()
+    return step
+
+def make_pooled_encode(camera, width, quality):
+    encoder = StreamEncoder(width=width, quality=quality)
+    return lambda frame: camera.render_jpeg(encoder, frame, [], [], overlay=False)
+
+def make_detection_step(camera):
+    def step(frame):
+        """Detection post-processing plus tracking, as run_pipeline does after forward()"""
+        detections = camera.detect_people(frame)
+        camera.update_tracking(detections, frame)
+        return detections
+    return step
+
+def main(args):
+    logging.disable(logging.WARNING)
+    rng = np.random.default_rng(0)
+    # A few distinct frames so encoding cost is realistic
+    pool = [rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(4)]
+    frames = [pool[i % len(pool)] for i in range(args.frames)]
+    flipped = [cv2.flip(frame, 1) for frame in frames]
+
+    camera = make_camera(StubCapture(pool), adaptive_inference=False)
+    baseline_capture = StubCapture(pool)
+
+    rows = [
+        ('capture', 'baseline cap.read()', lambda f: baseline_capture.read()[1], frames),
+        ('capture', 'pooled read_frame()', lambda f: camera.read_frame()[1], frames),
+        ('preprocess', 'baseline flip + blobFromImage', baseline_preprocess, frames),
+        ('preprocess', 'pooled BlobPreprocessor', camera.preprocessor.prepare, frames),
+    ]
+    for width in (int(w) for w in args.output_widths.split(',')):
+        rows.append((f'encode {width}px', 'baseline resize + imencode', make_baseline_encode(width, args.quality), flipped))
+        rows.append((f'encode {width}px', 'pooled render_jpeg', make_pooled_encode(camera, width, args.quality), frames))
+    for people in (int(p) for p in args.people.split(',')):
+        rows.append((f'detect+track {people} people', 'detect_people + update_tracking',
+                     make_detection_step(camera), frames))
+
+    print(f"{args.frames} frames at {args.width}x{args.height}, JPEG quality {args.quality}")
+    print(f"{'step':26s} {'path':32s} {'blocks/frame':>12s} {'KiB/frame':>10s}")
+    for group, name, step, inputs in rows:
+        if group.startswith('detect+track'):
+            # Fresh tracks for each crowd size
+            camera.net.people = int(group.split()[1])
+            camera.tracking_data.clear()
+        blocks, peak, lines = measure(step, inputs)
+        print(f"{group:26s} {name:32s} {blocks:12.1f} {peak / 1024:10.1f}")
+        for line, count in lines.most_common(args.top):
+            print(f"{'':26s}   {count / (len(inputs) - 10):6.1f}  {line}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--output-widths', default='1280,640', help='comma-separated encode widths')
+    parser.add_argument('--quality', type=int, default=70, help='JPEG quality used by both paths')
+    parser.add_argument('--people', default='0,5,20', help='comma-separated people per frame for tracking')
+    parser.add_argument('--top', type=int, default=2, help='source lines to list per step')
+    main(parser.parse_args())
@@ -0,0 +1,137 @@
+"""Repeatable check of /backup_recovery and of the schema migration it depends on.
+
+Builds a database with the original schema (no count_event.event_uid, no AUTOINCREMENT)
+holding a few events, and lets ensure_database_ready() migrate it. A fake camera then
+produces events. Some are saved normally and the rest are lost after being backed up, as
+when a save fails. Recovery runs twice, the second time over the same backup, as if the
+process died before clearing it. Both runs must report the right recovered/skipped counts,
+and the session and daily totals must match the events exactly once.
+
+    python benchmarks/check_recovery.py --saved 40 --lost 25 --legacy 10
+"""
+import argparse
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Tables as the first release created them, before event_uid and AUTOINCREMENT
+ORIGINAL_SCHEMA = """
+CREATE TABLE count_session (
+    id INTEGER NOT NULL, start_time DATETIME, end_time DATETIME, total_entries INTEGER, total_exits INTEGER,
+    PRIMARY KEY (id), UNIQUE (id)
+);
+CREATE TABLE count_event (
+    id INTEGER NOT NULL, session_id INTEGER NOT NULL, timestamp DATETIME NOT NULL, direction VARCHAR(3) NOT NULL,
+    people_count INTEGER NOT NULL, detection_confidence FLOAT NOT NULL,
+    PRIMARY KEY (id), UNIQUE (id), FOREIGN KEY(session_id) REFERENCES count_session (id)
+);
+CREATE TABLE daily_count (
+    id INTEGER NOT NULL, date DATE NOT NULL, total_entries INTEGER NOT NULL, total_exits INTEGER NOT NULL,
+    peak_occupancy INTEGER NOT NULL, current_occupancy INTEGER NOT NULL,
+    PRIMARY KEY (id), UNIQUE (id), UNIQUE (date)
+);
+"""
+
+def create_original_database(db_path, legacy):
+    """Original-schema database with one open session and `legacy` events saved today"""
+    now = datetime.utcnow().replace(microsecond=0)
+    events = [(i + 1, 1, (now - timedelta(seconds=legacy - i)).isoformat(sep=' '), 'IN' if i % 3 else 'OUT', 1, 0.9)
+              for i in range(legacy)]
+    entries = sum(1 for event in events if event[3] == 'IN')
+    exits = legacy - entries
+
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executescript(ORIGINAL_SCHEMA)
+        conn.execute('INSERT INTO count_session VALUES (1, ?, NULL, ?, ?)',
+                     ((now - timedelta(hours=1)).isoformat(sep=' '), entries, exits))
+        conn.executemany('INSERT INTO count_event VALUES (?, ?, ?, ?, ?, ?)', events)
+        conn.execute('INSERT INTO daily_count VALUES (1, ?, ?, ?, 0, ?)',
+                     (datetime.now().date().isoformat(), entries, exits, max(0, entries - exits)))
+    conn.close()
+    return entries, exits
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='people-counter-recovery-')
+    try:
+        return run_checks(args, os.path.join(workdir, 'recovery.db'))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def run_checks(args, db_path):
+    legacy_in, legacy_out = create_original_database(db_path, args.legacy)
+
+    # The database path is read when app.py is imported
+    os.environ['PEOPLE_COUNTER_DB'] = db_path
+    logging.disable(logging.ERROR)
+    import app as counter_app
+    from app import app, db, ensure_database_ready, save_pending_events, CountEvent, CountSession, DailyCount
+    from load_api import make_fake_camera
+
+    checks = []
+
+    def check(name, got, expected):
+        checks.append(got == expected)
+        print(f"{name:44s} {str(got):>18s}  expected {str(expected):18s} {'OK' if got == expected else 'MISMATCH'}")
+
+    with app.app_context():
+        ensure_database_ready()
+        ensure_database_ready()  # A second start must find nothing left to migrate
+        conn = sqlite3.connect(db_path)
+        table_sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'count_event'").fetchone()[0]
+        indexes = {name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'count_event'")}
+        conn.close()
+        check('migration: event_uid column', 'event_uid' in table_sql, True)
+        check('migration: AUTOINCREMENT', 'AUTOINCREMENT' in table_sql.upper(), True)
+        check('migration: unique event_uid index', 'ix_count_event_event_uid' in indexes, True)
+        check('migration: legacy events kept', CountEvent.query.count(), args.legacy)
+
+        camera = make_fake_camera()
+        counter_app.people_counter_camera = camera
+        client = app.test_client()
+
+        # Saved normally, so they are in the database and in the backup
+        camera.inject_burst(args.saved)
+        save_pending_events(camera)
+        # Handed out and backed up, but never saved
+        camera.inject_burst(args.lost)
+        camera.get_and_clear_events()
+        backup = camera.get_backup_events()
+
+        entries = legacy_in + sum(e['people_count'] for e in backup if e['direction'] == 'IN')
+        exits = legacy_out + sum(e['people_count'] for e in backup if e['direction'] == 'OUT')
+
+        for run, (recovered, skipped) in enumerate([(args.lost, args.saved), (0, args.saved + args.lost)], 1):
+            if run > 1:
+                # The previous recovery saved everything but died before clearing the backup
+                camera.backup_events.extend(backup)
+            reply = client.post('/backup_recovery').get_json()
+            db.session.expire_all()
+            check(f'run {run}: status', reply['status'], 'success')
+            check(f'run {run}: recovered / skipped', (reply.get('recovered_count'), reply.get('skipped_count')),
+                  (recovered, skipped))
+            check(f'run {run}: saved events', CountEvent.query.count(), args.legacy + args.saved + args.lost)
+            session = CountSession.query.filter_by(end_time=None).one()
+            check(f'run {run}: session totals', (session.total_entries, session.total_exits), (entries, exits))
+            today = DailyCount.query.filter_by(date=datetime.now().date()).one()
+            check(f'run {run}: daily totals', (today.total_entries, today.total_exits), (entries, exits))
+            check(f'run {run}: backup cleared', len(camera.get_backup_events()), 0)
+
+    ok = all(checks)
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--saved', type=int, default=40, help='events saved before the backup is recovered')
+    parser.add_argument('--lost', type=int, default=25, help='events only in the backup')
+    parser.add_argument('--legacy', type=int, default=10, help='events already in the original-schema database')
+    sys.exit(main(parser.parse_args()))
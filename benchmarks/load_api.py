@@ -0,0 +1,212 @@
+"""Load test: latency and throughput of the HTTP API against databases of different history sizes.
+
+For each history size a fresh SQLite database is filled with synthetic events by bulk SQL
+inserts, then the app is driven through Flask's test client in a separate process (the
+database path is fixed when app.py is imported). The camera runs on the stub capture and
+model from stubs.py and has bursts of count events injected, so the ingest path
+(/check_count_events) does real work.
+
+    python benchmarks/load_api.py --sizes 10000,1000000,10000000 --requests 100
+
+Populated databases are rebuilt on every run unless --db-dir points at a directory to keep
+them in. Logging is disabled while measuring; failing routes show up in the status column
+(/stats currently answers 500 because templates/stats.html does not exist).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Route label -> path; /api/stats is measured both without and with a matching ETag
+ROUTES = [
+    ('check_count_events', '/check_count_events'),
+    ('api_stats', '/api/stats'),
+    ('api_stats_304', '/api/stats'),
+    ('api_occupancy_series', '/api/occupancy/series?resolution=minute&points=1440'),
+    ('index', '/'),
+    ('stats', '/stats'),
+    ('auto_save_status', '/auto_save_status'),
+]
+
+def populate(db_path, events, days):
+    """Fill the schema created by the app with `events` events spread evenly over `days` days"""
+    start = (datetime.now() - timedelta(days=days)).replace(microsecond=0)
+    spacing = days * 86400 / events
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    with conn:
+        # One session per day, the last one still open; roughly 60% of crossings are entries
+        conn.execute("""
+            WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i < ? - 1)
+            INSERT INTO count_event (session_id, timestamp, direction, people_count, detection_confidence)
+            SELECT 1 + CAST(i * ? / 86400 AS INTEGER),
+                   datetime(?, '+' || CAST(i * ? AS INTEGER) || ' seconds'),
+                   CASE WHEN abs(random()) % 10 < 6 THEN 'IN' ELSE 'OUT' END,
+                   1,
+                   0.5 + (abs(random()) % 50) / 100.0
+            FROM seq
+        """, (events, spacing, start.isoformat(sep=' '), spacing))
+        conn.execute("""
+            INSERT INTO count_session (id, start_time, end_time, total_entries, total_exits)
+            SELECT session_id, MIN(timestamp), MAX(timestamp),
+                   SUM(CASE WHEN direction = 'IN' THEN people_count ELSE 0 END),
+                   SUM(CASE WHEN direction = 'OUT' THEN people_count ELSE 0 END)
+            FROM count_event GROUP BY session_id
+        """)
+        conn.execute('UPDATE count_session SET end_time = NULL WHERE id = (SELECT MAX(id) FROM count_session)')
+        conn.execute("""
+            INSERT INTO daily_count (date, total_entries, total_exits, peak_occupancy, current_occupancy)
+            SELECT date(timestamp),
+                   SUM(CASE WHEN direction = 'IN' THEN people_count ELSE 0 END),
+                   SUM(CASE WHEN direction = 'OUT' THEN people_count ELSE 0 END),
+                   0, 0
+            FROM count_event GROUP BY date(timestamp)
+        """)
+    conn.close()
+
+def make_fake_camera():
+    """A real PeopleCounterCamera on the stub capture and model, with count events injected"""
+    import stubs
+    from camera_controller import PeopleCounterCamera
+
+    class FakeCamera(PeopleCounterCamera):
+        """Its pipeline is never started; inject_burst stands in for people crossing the line"""
+
+        def inject_burst(self, size):
+            """Append `size` crossings at once, like a group walking through the door"""
+            events = []
+            for _ in range(size):
+                events.append({
+                    'event_id': uuid.uuid4().hex,
+                    'direction': 'IN' if self.rng.random() < 0.6 else 'OUT',
+                    'people_count': 1,
+                    'confidence': self.rng.uniform(0.5, 1.0),
+                    'timestamp': datetime.now(),
+                    'track_id': self.next_person_id
+                })
+                self.next_person_id += 1
+            self.count_events.extend(events)
+
+    camera = stubs.make_camera(camera_class=FakeCamera)
+    camera.rng = random.Random(0)
+    return camera
+
+def measure(client, label, path, args, camera):
+    """Issue requests to one route for up to --requests requests or --max-seconds seconds"""
+    latencies = []
+    statuses = {}
+    events = 0
+    headers = {}
+    if label == 'api_stats_304':
+        headers['If-None-Match'] = client.get(path).headers.get('ETag', '')
+
+    deadline = time.perf_counter() + args.max_seconds
+    while len(latencies) < args.requests and time.perf_counter() < deadline:
+        if label == 'check_count_events':
+            camera.inject_burst(args.burst)
+            events += args.burst
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        response.get_data()
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    latencies.sort()
+    total = sum(latencies)
+    return {
+        'route': label,
+        'requests': len(latencies),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'req_per_s': len(latencies) / total if total else 0.0,
+        'events_per_s': events / total if total and events else None,
+        'statuses': statuses
+    }
+
+def run_size(args):
+    """Child process: build the database for one size and measure every route against it"""
+    db_path = os.environ['PEOPLE_COUNTER_DB']
+    logging.disable(logging.ERROR)
+
+    import app as counter_app
+    from app import app, db, ensure_database_ready
+
+    if not os.path.exists(db_path):
+        with app.app_context():
+            db.create_all()
+        start = time.perf_counter()
+        populate(db_path, args.events, args.days)
+        print(f"Populated {args.events} events in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    with app.app_context():
+        ensure_database_ready()
+
+    camera = make_fake_camera()
+    counter_app.people_counter_camera = camera
+    client = app.test_client()
+
+    results = [measure(client, label, path, args, camera) for label, path in ROUTES]
+    print(json.dumps({'events': args.events, 'db_bytes': os.path.getsize(db_path), 'results': results}))
+
+def run_all(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    db_dir = args.db_dir or tempfile.mkdtemp(prefix='people-counter-load-')
+    os.makedirs(db_dir, exist_ok=True)
+
+    try:
+        for size in sizes:
+            db_path = os.path.join(db_dir, f'events-{size}.db')
+            if not args.db_dir and os.path.exists(db_path):
+                os.remove(db_path)
+            env = dict(os.environ, PEOPLE_COUNTER_DB=db_path)
+            output = subprocess.run(
+                [sys.executable, __file__, 'size', '--events', str(size), '--days', str(args.days),
+                 '--requests', str(args.requests), '--max-seconds', str(args.max_seconds),
+                 '--burst', str(args.burst)],
+                cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True, check=True).stdout
+            report = json.loads(output.strip().splitlines()[-1])
+
+            print(f"\n{report['events']:,} events in history ({report['db_bytes'] / 1e6:.0f} MB database)")
+            print(f"{'route':22s} {'requests':>8s} {'p50 ms':>9s} {'p95 ms':>9s} {'max ms':>9s} "
+                  f"{'req/s':>9s} {'events/s':>9s}  statuses")
+            for r in report['results']:
+                events_per_s = f"{r['events_per_s']:9.0f}" if r['events_per_s'] else f"{'-':>9s}"
+                print(f"{r['route']:22s} {r['requests']:8d} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} "
+                      f"{r['max_ms']:9.2f} {r['req_per_s']:9.1f} {events_per_s}  {r['statuses']}")
+    finally:
+        if not args.db_dir:
+            shutil.rmtree(db_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', default='all', choices=['all', 'size'])
+    parser.add_argument('--sizes', default='10000,1000000,10000000', help='comma-separated history sizes')
+    parser.add_argument('--days', type=int, default=30, help='days of history the events are spread over')
+    parser.add_argument('--requests', type=int, default=100, help='requests per route')
+    parser.add_argument('--max-seconds', type=float, default=30.0, help='time limit per route')
+    parser.add_argument('--burst', type=int, default=20, help='events injected before each /check_count_events')
+    parser.add_argument('--db-dir', help='keep populated databases here and reuse them')
+    # Size mode option
+    parser.add_argument('--events', type=int)
+    args = parser.parse_args()
+
+    if args.mode == 'size':
+        run_size(args)
+    else:
+        run_all(args)
@@ -0,0 +1,150 @@
+"""Local multi-node aggregation test: one central instance and several edge nodes on one machine.
+
+Starts `app.py` as the aggregator with its own temporary database, then starts edge
+processes that generate synthetic entry/exit events and push them with EdgePusher.
+The edges start before the aggregator is up, so offline buffering and cursor resync
+are exercised. Edges send UTC timestamps like real nodes, and the aggregator runs in a time
+zone whose date differs from the UTC date, so events must be bucketed by its local day. Each edge finally replays its whole log to check idempotent ingestion.
+The building/floor totals reported by the aggregator are compared with what the edges sent.
+
+    python benchmarks/simulate_building.py --edges 6 --floors 3 --events 2000
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def run_edge(args):
+    """Edge process: generate events over time and push them until all are acknowledged"""
+    from aggregation import EdgePusher
+
+    rng = random.Random(args.node_id)
+    start = datetime.now(timezone.utc)
+    # [seq, timestamp, direction, people count]; more entries than exits, like a morning
+    log = [(seq, start + timedelta(milliseconds=seq), 'IN' if rng.random() < 0.6 else 'OUT', 1)
+           for seq in range(1, args.events + 1)]
+    produce_until = time.monotonic() + args.duration
+
+    def fetch_events(after_seq, limit):
+        # Events become visible gradually, as if counted live
+        progress = 1.0 - max(0.0, produce_until - time.monotonic()) / args.duration
+        available = int(len(log) * progress)
+        return log[after_seq:min(after_seq + limit, available)]
+
+    pusher = EdgePusher(args.aggregator, args.node_id, fetch_events, building='hq', floor=args.floor,
+                        interval=0.2, batch_size=args.batch_size, max_backoff=1.0).start()
+    deadline = time.monotonic() + args.duration + args.timeout
+    while pusher.acked_seq != len(log) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    pusher.stop()
+
+    # Replay everything: an idempotent aggregator must accept none of it
+    pusher.acked_seq = 0
+    replay = pusher.request('POST', '/api/aggregate/ingest', {
+        'node_id': args.node_id, 'building': 'hq', 'floor': args.floor,
+        'events': [[seq, ts.isoformat(), d, n] for seq, ts, d, n in log]
+    })
+
+    print(json.dumps({
+        'node_id': args.node_id,
+        'floor': args.floor,
+        'complete': replay['last_seq'] == len(log),
+        'replay_accepted': replay['accepted'],
+        'entries': sum(n for _, _, d, n in log if d == 'IN'),
+        'exits': sum(n for _, _, d, n in log if d == 'OUT'),
+        'failed_pushes': pusher.failed_pushes
+    }))
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+def skewed_timezone():
+    """A TZ whose local date differs from the UTC date right now (UTC+14 or UTC-12)"""
+    now = datetime.now(timezone.utc)
+    # POSIX Etc zones have inverted signs: Etc/GMT-14 is UTC+14
+    return 'Etc/GMT-14' if (now + timedelta(hours=14)).date() != now.date() else 'Etc/GMT+12'
+
+def run_cluster(args):
+    workdir = tempfile.mkdtemp(prefix='people-counter-cluster-')
+    aggregator = f'http://127.0.0.1:{args.port}'
+
+    # Edges first: the aggregator is not up yet, so they must buffer and retry
+    edges = []
+    for i in range(args.edges):
+        floor = str(i % args.floors + 1)
+        edges.append(subprocess.Popen(
+            [sys.executable, __file__, 'edge', '--node-id', f'edge-{i}', '--floor', floor,
+             '--aggregator', aggregator, '--events', str(args.events), '--duration', str(args.duration),
+             '--batch-size', str(args.batch_size)],
+            stdout=subprocess.PIPE, text=True))
+
+    time.sleep(args.offline_seconds)
+    tz = args.aggregator_tz or skewed_timezone()
+    env = dict(os.environ, PEOPLE_COUNTER_DB=os.path.join(workdir, 'central.db'), PORT=str(args.port), TZ=tz)
+    central = subprocess.Popen([sys.executable, os.path.join(ROOT, 'app.py')], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.monotonic()
+
+    try:
+        reports = [json.loads(edge.communicate()[0].strip().splitlines()[-1]) for edge in edges]
+        elapsed = time.monotonic() - start
+        occupancy = get_json(f'{aggregator}/api/aggregate/occupancy')
+    finally:
+        central.terminate()
+        central.wait()
+
+    floors = occupancy['buildings'].get('hq', {}).get('floors', {})
+    ok = True
+    for floor in sorted({r['floor'] for r in reports}):
+        expected_in = sum(r['entries'] for r in reports if r['floor'] == floor)
+        expected_out = sum(r['exits'] for r in reports if r['floor'] == floor)
+        got = floors.get(floor, {'entries': 0, 'exits': 0, 'occupancy': 0})
+        match = (got['entries'], got['exits']) == (expected_in, expected_out)
+        ok &= match
+        print(f"Floor {floor}: expected {expected_in} in / {expected_out} out, "
+              f"aggregator {got['entries']} in / {got['exits']} out, occupancy {got['occupancy']} "
+              f"{'OK' if match else 'MISMATCH'}")
+
+    total_events = args.edges * args.events
+    print(f"Edges complete: {sum(r['complete'] for r in reports)}/{len(reports)}, "
+          f"replayed events accepted: {sum(r['replay_accepted'] for r in reports)} (expected 0), "
+          f"failed pushes while offline: {sum(r['failed_pushes'] for r in reports)}")
+    print(f"Aggregator time zone {tz}")
+    print(f"Ingested {total_events} events from {args.edges} nodes in {elapsed:.1f}s "
+          f"({total_events / elapsed:.0f} events/s including generation time)")
+    ok &= all(r['complete'] and r['replay_accepted'] == 0 for r in reports)
+    print('PASS' if ok else 'FAIL')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', default='cluster', choices=['cluster', 'edge'])
+    parser.add_argument('--edges', type=int, default=4)
+    parser.add_argument('--floors', type=int, default=2)
+    parser.add_argument('--events', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds over which each edge produces events')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--offline-seconds', type=float, default=2.0, help='delay before starting the aggregator')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--aggregator-tz', help='TZ for the aggregator; defaults to one on a different date than UTC')
+    # Edge mode options
+    parser.add_argument('--node-id')
+    parser.add_argument('--floor', default='1')
+    parser.add_argument('--aggregator')
+    args = parser.parse_args()
+
+    if args.mode == 'edge':
+        run_edge(args)
+    else:
+        sys.exit(run_cluster(args))
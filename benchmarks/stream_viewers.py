@@ -0,0 +1,95 @@
+"""Load test: open many concurrent MJPEG viewers against a running server.
+
+Start the server first, e.g.:
+    uvicorn asgi:application --port 8000
+
+or, without a camera or model files, the same ASGI app fed by a synthetic 1280x720 30 fps
+source and a stub detector (one person walking across the frame):
+    python benchmarks/stream_viewers.py serve --port 8000
+
+Then:
+    python benchmarks/stream_viewers.py --viewers 300 --duration 30 --path "/video_feed?width=320&fps=5"
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+async def viewer(host, port, path, duration, results):
+    """Hold one streaming connection open and count the frames received"""
+    frames = 0
+    received = 0
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+
+        deadline = time.monotonic() + duration
+        tail = b''
+        while time.monotonic() < deadline:
+            try:
+                chunk = await asyncio.wait_for(reader.read(65536), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            received += len(chunk)
+            # Count multipart boundaries, including ones split across reads
+            data = tail + chunk
+            frames += data.count(b'--frame')
+            tail = data[-6:]
+
+        writer.close()
+        results.append({'ok': True, 'frames': frames, 'bytes': received})
+    except OSError as e:
+        results.append({'ok': False, 'error': str(e), 'frames': frames, 'bytes': received})
+
+def serve(args):
+    """Run asgi:application under uvicorn with a synthetic capture source and detector"""
+    os.environ.setdefault('PEOPLE_COUNTER_DB', os.path.join(tempfile.mkdtemp(prefix='people-counter-stream-'), 'stream.db'))
+    import stubs
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import uvicorn
+
+    stubs.install(lambda config: stubs.StubCapture(fps=30))
+    uvicorn.run('asgi:application', host=args.host, port=args.port, log_level='warning')
+
+async def main(args):
+    results = []
+    start = time.monotonic()
+    await asyncio.gather(*(viewer(args.host, args.port, args.path, args.duration, results)
+                           for _ in range(args.viewers)))
+    elapsed = time.monotonic() - start
+
+    ok = [r for r in results if r['ok'] and r['frames'] > 0]
+    fps = [r['frames'] / args.duration for r in ok]
+    total_bytes = sum(r['bytes'] for r in results)
+
+    print(f"Viewers requested:  {args.viewers}")
+    print(f"Viewers served:     {len(ok)}")
+    print(f"Failed/starved:     {args.viewers - len(ok)}")
+    if fps:
+        print(f"Per-viewer fps:     median {statistics.median(fps):.1f}, "
+              f"min {min(fps):.1f}, max {max(fps):.1f}")
+    print(f"Total throughput:   {total_bytes / elapsed / 1e6:.1f} MB/s over {elapsed:.1f}s")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('mode', nargs='?', default='load', choices=['load', 'serve'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--path', default='/video_feed?width=320&fps=5')
+    parser.add_argument('--viewers', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=20.0)
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        serve(args)
+    else:
+        asyncio.run(main(args))
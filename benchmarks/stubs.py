@@ -0,0 +1,85 @@
+"""Stand-ins for the capture device and the detection model, so benchmarks need neither.
+
+install() patches camera_controller so that every PeopleCounterCamera created afterwards,
+including the one app.py creates on demand, reads frames from a StubCapture and detects
+with a StubNet. The camera itself is always the real class.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import camera_controller
+
+class StubCapture:
+    """Capture source that fills frames the way cv2.VideoCapture.read(dst) does.
+
+    Replays `frames` in turn when given; otherwise draws a block moving across a gradient,
+    so consecutive frames differ. With `fps`, reads are paced like a live camera.
+    """
+
+    def __init__(self, frames=None, width=1280, height=720, fps=None):
+        if frames is None:
+            background = np.repeat(np.linspace(0, 255, width, dtype=np.uint8)[None, :, None], height, axis=0)
+            self.background = np.repeat(background, 3, axis=2)
+        self.frames = frames
+        self.frame_interval = 1.0 / fps if fps else 0.0
+        self.next_frame = time.monotonic()
+        self.index = 0
+
+    def read(self, dst=None):
+        if self.frame_interval:
+            time.sleep(max(0.0, self.next_frame - time.monotonic()))
+            self.next_frame += self.frame_interval
+
+        source = self.frames[self.index % len(self.frames)] if self.frames is not None else self.background
+        frame = dst if dst is not None and dst.shape == source.shape else np.empty_like(source)
+        np.copyto(frame, source)
+        if self.frames is None:
+            x = self.index * 8 % (frame.shape[1] - 120)
+            frame[200:500, x:x + 120] = (40, 80, 200)
+        self.index += 1
+        return True, frame
+
+    def isOpened(self):
+        return True
+
+    def get(self, prop):
+        return 0
+
+    def release(self):
+        pass
+
+class StubNet:
+    """Stands in for MobileNet SSD: `people` person boxes walking across the frame, plus
+    rows of other classes and of low confidence that detection has to filter out"""
+
+    def __init__(self, people=1):
+        self.people = people
+        self.calls = 0
+
+    def setInput(self, blob):
+        pass
+
+    def forward(self):
+        self.calls += 1
+        rows = np.zeros((1, 1, self.people + 5, 7), dtype=np.float32)
+        for i in range(self.people):
+            x = (self.calls * 0.00625 + i / self.people) % 0.9
+            y = (i % 4) * 0.2
+            rows[0, 0, i] = (0, 15, 0.9, x, y, x + 0.08, y + 0.3)
+        rows[0, 0, self.people:, 1:3] = (7, 0.9)
+        rows[0, 0, -1, 1:3] = (15, 0.1)
+        return rows
+
+def install(capture_factory=None):
+    """Make new cameras read from capture_factory(config) (default StubCapture()) and use a StubNet"""
+    camera_controller.open_capture = capture_factory or (lambda config: StubCapture())
+    camera_controller.cv2.dnn.readNetFromCaffe = lambda prototxt, model: StubNet()
+
+def make_camera(capture=None, camera_class=None, **config):
+    """A real, headless PeopleCounterCamera (or subclass) reading from `capture` with a StubNet"""
+    install(lambda config: capture or StubCapture())
+    return (camera_class or camera_controller.PeopleCounterCamera)(headless=True, capture=config)
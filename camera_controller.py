@@ -3,21 +3,364 @@ import numpy as np
 import time
 from datetime import datetime
 import os
-from threading import Thread, Event
+import json
+import math
+import uuid
+from threading import Thread, Event, Condition
 import logging
+from contextlib import contextmanager
+from event_buffer import EventBuffer
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Capture backends selectable by name
+CAPTURE_BACKENDS = {
+    'any': cv2.CAP_ANY,
+    'v4l2': cv2.CAP_V4L2,
+    'gstreamer': cv2.CAP_GSTREAMER,
+    'ffmpeg': cv2.CAP_FFMPEG,
+}
+
+DEFAULT_CAPTURE_CONFIG = {
+    'source': 0,            # Device index, file path, stream URL or full GStreamer pipeline
+    'backend': 'any',       # One of CAPTURE_BACKENDS
+    'fourcc': None,         # Camera pixel format for V4L2, e.g. 'MJPG' or 'YUYV'
+    'width': 1280,          # Requested capture size; lower it to get smaller frames from the driver
+    'height': 720,
+    'fps': 30,
+    'buffer_size': 1,       # Frames queued in the driver; 1 avoids processing stale frames
+    'hw_decode': True,      # Ask FFmpeg/GStreamer for hardware-accelerated decoding if available
+    'mirror': True,         # Mirror view (coordinates are mirrored instead of flipping each frame)
+    'inference_size': 300,  # MobileNet SSD input size (the largest the adaptive scheduler uses)
+    'adaptive_inference': True,  # Lower input size/threshold and skip frames when detection falls behind
+    'target_fps': None,     # Frame rate detection must keep up with; defaults to 'fps'
+}
+
+def build_gstreamer_pipeline(source, config):
+    """Build a GStreamer pipeline that decodes, scales and converts to BGR before appsink"""
+    if isinstance(source, str) and '!' in source:
+        return source  # Already a full pipeline
+    
+    if isinstance(source, int) or str(source).isdigit():
+        src = f"v4l2src device=/dev/video{source}"
+    elif '://' in str(source):
+        src = f"uridecodebin uri={source}"
+    else:
+        src = f"filesrc location={source} ! decodebin"
+    
+    return (f"{src} ! videoconvert ! videoscale ! "
+            f"video/x-raw,format=BGR,width={config['width']},height={config['height']} ! "
+            f"appsink drop=true max-buffers={max(config['buffer_size'], 1)} sync=false")
+
+def open_capture(config):
+    """Open a video source according to a capture configuration dict"""
+    source = config['source']
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    backend_name = config['backend']
+    backend = CAPTURE_BACKENDS.get(backend_name)
+    if backend is None:
+        raise ValueError(f"Unknown capture backend: {backend_name}")
+    
+    params = []
+    if config['hw_decode'] and backend_name in ('ffmpeg', 'gstreamer') and hasattr(cv2, 'CAP_PROP_HW_ACCELERATION'):
+        params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+    
+    if backend_name == 'gstreamer':
+        cap = cv2.VideoCapture(build_gstreamer_pipeline(source, config), backend, params)
+    else:
+        cap = cv2.VideoCapture(source, backend, params)
+        
+        if isinstance(source, int):
+            # The pixel format must be chosen before the frame size on V4L2 devices
+            if config['fourcc']:
+                cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*config['fourcc']))
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, config['width'])
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config['height'])
+            cap.set(cv2.CAP_PROP_FPS, config['fps'])
+        
+        if config['buffer_size']:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, config['buffer_size'])
+    
+    if not cap.isOpened():
+        logger.error(f"Failed to open capture source {source!r} with backend {backend_name}")
+    else:
+        logger.info(f"Opened capture source {source!r} ({backend_name}): "
+                    f"{int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}")
+    return cap
+
+def greedy_match(cost, max_cost):
+    """Pair rows with columns, cheapest first, skipping pairs costing max_cost or more.
+    
+    Returns a list of (row, col) index pairs; each row and column is used at most once.
+    """
+    pairs = []
+    if cost.size == 0:
+        return pairs
+    
+    used_rows = set()
+    used_cols = set()
+    for flat_index in np.argsort(cost, axis=None):
+        row, col = divmod(int(flat_index), cost.shape[1])
+        if cost[row, col] >= max_cost:
+            break
+        if row in used_rows or col in used_cols:
+            continue
+        pairs.append((row, col))
+        used_rows.add(row)
+        used_cols.add(col)
+    return pairs
+
+class BlobPreprocessor:
+    """Build the network input blob in preallocated buffers instead of allocating per frame"""
+    
+    def __init__(self, size=300, scale=0.007843, mean=(127.5, 0.0, 0.0)):
+        """Same preprocessing as cv2.dnn.blobFromImage(cv2.resize(frame, (size, size)), scale, (size, size), 127.5).
+        
+        blobFromImage turns a scalar mean into Scalar(127.5, 0, 0, 0), so only the first
+        channel is mean-subtracted; the default mean reproduces that exactly.
+        """
+        self.size = size
+        self.scale = scale
+        self.mean = np.array(mean, dtype=np.float32).reshape(-1, 1, 1)  # Broadcasts over CHW
+        self.resized = None  # HWC uint8 resize destination
+        self.blob = None     # NCHW float32 network input
+    
+    def prepare(self, frame):
+        """Resize and normalise a frame into the reused blob buffer and return it"""
+        channels = frame.shape[2]
+        if self.blob is None or self.blob.shape != (1, channels, self.size, self.size):
+            self.resized = np.empty((self.size, self.size, channels), dtype=np.uint8)
+            self.blob = np.empty((1, channels, self.size, self.size), dtype=np.float32)
+            logger.info(f"Allocated inference buffers for {self.size}x{self.size} input")
+        
+        cv2.resize(frame, (self.size, self.size), dst=self.resized)
+        
+        # HWC -> CHW is just a transposed view, copied (and cast) straight into the blob;
+        # normalisation then runs in place
+        np.copyto(self.blob[0], self.resized.transpose(2, 0, 1))
+        np.subtract(self.blob, self.mean, out=self.blob)
+        np.multiply(self.blob, self.scale, out=self.blob)
+        return self.blob
+
+class StreamEncoder:
+    """Per-viewer JPEG encoder with frame pacing and an adaptive quality/resolution ladder"""
+    # (scale, JPEG quality) steps from best to cheapest
+    LADDER = [(1.0, 85), (1.0, 70), (0.75, 70), (0.5, 60), (0.5, 45), (0.35, 40)]
+    
+    def __init__(self, width=None, quality=None, max_fps=None):
+        """Configure output width, maximum JPEG quality and frame rate for one stream"""
+        self.target_width = width
+        self.max_quality = quality
+        self.frame_interval = 1.0 / max_fps if max_fps else 0.0
+        
+        # Backpressure settings: a slow send means the client's socket is backing up
+        self.slow_send_threshold = max(self.frame_interval, 0.1)
+        self.frames_before_upgrade = 30
+        
+        self.level = 0
+        self.good_sends = 0
+        self.last_sent = 0.0
+        self.resize_buffer = None
+        self.flip_buffer = None
+    
+    def should_send(self, now):
+        """Check whether the next frame is due under the max fps limit"""
+        return now - self.last_sent >= self.frame_interval
+    
+    def scale(self, frame):
+        """Resize a frame to the output size of the current ladder step"""
+        scale = self.LADDER[self.level][0]
+        height, width = frame.shape[:2]
+        out_width = min(self.target_width or width, width)
+        out_width = max(int(out_width * scale), 16)
+        out_height = max(int(height * out_width / width), 16)
+        
+        if (out_width, out_height) == (width, height):
+            return frame
+        
+        # Reuse the destination array between frames instead of allocating a new one
+        if self.resize_buffer is None or self.resize_buffer.shape[:2] != (out_height, out_width):
+            self.resize_buffer = np.empty((out_height, out_width, frame.shape[2]), dtype=frame.dtype)
+        return cv2.resize(frame, (out_width, out_height), dst=self.resize_buffer,
+                          interpolation=cv2.INTER_AREA)
+    
+    def mirror(self, frame):
+        """Flip a frame horizontally into a reused buffer"""
+        if self.flip_buffer is None or self.flip_buffer.shape != frame.shape:
+            self.flip_buffer = np.empty_like(frame)
+        return cv2.flip(frame, 1, dst=self.flip_buffer)
+    
+    def compress(self, frame):
+        """Encode an already scaled frame as JPEG using the current ladder step"""
+        quality = self.LADDER[self.level][1]
+        if self.max_quality is not None:
+            quality = min(quality, self.max_quality)
+        
+        ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if ret else None
+    
+    def encode(self, frame):
+        """Scale and encode a frame as JPEG using the current ladder step"""
+        return self.compress(self.scale(frame))
+    
+    def record_send(self, now, send_duration):
+        """Step down the ladder when sends block, back up after a run of fast sends"""
+        self.last_sent = now
+        
+        if send_duration > self.slow_send_threshold:
+            self.good_sends = 0
+            if self.level < len(self.LADDER) - 1:
+                self.level += 1
+                logger.info(f"Stream backing up ({send_duration:.2f}s send), "
+                            f"downgrading to {self.LADDER[self.level]}")
+        else:
+            self.good_sends += 1
+            if self.level > 0 and self.good_sends >= self.frames_before_upgrade:
+                self.level -= 1
+                self.good_sends = 0
+                logger.info(f"Stream recovered, upgrading to {self.LADDER[self.level]}")
+
+class InferenceScheduler:
+    """Hold detection within a per-frame time budget by trading input size, frame rate and threshold.
+    
+    Detection time is smoothed with an exponential moving average. When the average no longer
+    fits the budget the scheduler steps down a ladder of cheaper settings; after a run of
+    frames with headroom it steps back up if the better step is predicted to fit. In a crowd
+    at most `crowd_max_skip` frames are skipped, because nearest-center tracking needs people
+    to move little between detections, so cost is cut with input size instead.
+    """
+    # (input size, frames skipped between detections, min confidence) from best to cheapest.
+    # Smaller inputs score the same person lower, so the threshold eases with the size.
+    LADDER = [(300, 0, 0.5), (300, 1, 0.5), (256, 1, 0.45), (224, 2, 0.45), (192, 2, 0.4), (192, 3, 0.4)]
+    
+    def __init__(self, target_fps, max_size=300, crowd_threshold=8, crowd_max_skip=1):
+        """Schedule detection for frames arriving at target_fps, never above max_size input"""
+        if target_fps is None or not math.isfinite(target_fps) or target_fps <= 0:
+            raise ValueError(f"target_fps must be a positive number, got {target_fps!r}")
+        self.frame_budget = 1.0 / target_fps
+        self.ladder = list(dict.fromkeys((min(size, max_size), skip, confidence)
+                                         for size, skip, confidence in self.LADDER))
+        self.crowd_threshold = crowd_threshold
+        self.crowd_max_skip = crowd_max_skip
+        
+        # Controller settings
+        self.smoothing = 0.2  # EMA weight of the newest detection time
+        self.cooldown_frames = 15  # Detections to wait after a change before judging it
+        self.frames_before_upgrade = 60  # Detections under budget before trying a better step
+        self.upgrade_headroom = 0.8  # The better step must be predicted to use less than this
+        
+        self.level = 0
+        self.latency = None  # Seconds per detection (EMA)
+        self.crowd_size = 0.0  # People per detection (EMA)
+        self.crowded = False
+        self.frames_skipped = 0
+        self.frames_since_change = 0
+        self.good_frames = 0
+        self.changes = 0
+    
+    @property
+    def settings(self):
+        """(input size, frames skipped between detections, min confidence) currently in effect"""
+        size, skip, confidence = self.ladder[self.level]
+        return size, self.effective_skip(skip), confidence
+    
+    def effective_skip(self, skip):
+        return min(skip, self.crowd_max_skip) if self.crowded else skip
+    
+    def should_detect(self):
+        """Whether the next captured frame goes through detection"""
+        if self.frames_skipped >= self.settings[1]:
+            self.frames_skipped = 0
+            return True
+        self.frames_skipped += 1
+        return False
+    
+    def load(self, level=None):
+        """Predicted share of the frame budget used at a ladder step (1.0 is exactly on budget)"""
+        size, skip, _ = self.ladder[self.level if level is None else level]
+        # Detection cost scales roughly with the number of input pixels
+        latency = self.latency * (size / self.ladder[self.level][0]) ** 2
+        return latency / ((self.effective_skip(skip) + 1) * self.frame_budget)
+    
+    def record(self, latency, crowd_size):
+        """Account for one detection and step the ladder if needed; returns True if settings changed"""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.smoothing * (latency - self.latency)
+        self.frames_since_change += 1
+        
+        # Enter crowd mode at the threshold but only leave it well below, so it does not flap
+        self.crowd_size += self.smoothing * (crowd_size - self.crowd_size)
+        if self.crowded != (self.crowd_size >= (self.crowd_threshold / 2 if self.crowded else self.crowd_threshold)):
+            self.crowded = not self.crowded
+            logger.info(f"{'Crowded scene' if self.crowded else 'Crowd cleared'} ({self.crowd_size:.1f} people): "
+                        f"skipping up to {self.settings[1]} frames between detections")
+        
+        if self.frames_since_change < self.cooldown_frames:
+            return False
+        
+        load = self.load()
+        if load > 1.0:
+            self.good_frames = 0
+            if self.level < len(self.ladder) - 1:
+                return self.change_level(self.level + 1, load)
+        else:
+            self.good_frames += 1
+            if (self.level > 0 and self.good_frames >= self.frames_before_upgrade
+                    and self.load(self.level - 1) < self.upgrade_headroom):
+                return self.change_level(self.level - 1, load)
+        return False
+    
+    def change_level(self, level, load):
+        old_size = self.ladder[self.level][0]
+        direction = 'Downgrading' if level > self.level else 'Upgrading'
+        self.level = level
+        self.frames_since_change = 0
+        self.good_frames = 0
+        self.changes += 1
+        
+        # Predict the new detection time until fresh measurements replace it
+        size, skip, confidence = self.settings
+        self.latency *= (size / old_size) ** 2
+        logger.info(f"{direction} inference at {load:.0%} of the {self.frame_budget * 1000:.0f}ms frame budget: "
+                    f"input {size}x{size}, skip {skip} frames, min confidence {confidence:.2f}")
+        return True
+    
+    def stats(self):
+        size, skip, confidence = self.settings
+        return {
+            'level': self.level,
+            'input_size': size,
+            'skip_frames': skip,
+            'min_confidence': confidence,
+            'detection_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'budget_ms': round(self.frame_budget * 1000, 1),
+            'crowd_size': round(self.crowd_size, 1),
+            'crowded': self.crowded,
+            'changes': self.changes
+        }
+
 class PeopleCounterCamera:
-    def __init__(self):
+    def __init__(self, headless=False, capture=None):
         """Initialize the people counter camera system"""
-        # Camera settings
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.cap.set(cv2.CAP_PROP_FPS, 30)
+        # Camera settings (see DEFAULT_CAPTURE_CONFIG)
+        self.capture_config = dict(DEFAULT_CAPTURE_CONFIG, **(capture or {}))
+        self.cap = open_capture(self.capture_config)
+        self.mirror = self.capture_config['mirror']
+        self.inference_size = self.capture_config['inference_size']
+        self.preprocessor = BlobPreprocessor(self.inference_size)
+        
+        # Pool of reused capture buffers. A buffer is only captured into when it is neither the
+        # published frame nor pinned by a viewer still encoding it (see pinned_frame); if every
+        # buffer is busy the pool grows instead of overwriting one.
+        self.capture_pool = [None] * 3
+        self.frame_readers = [0] * len(self.capture_pool)  # Viewers pinning each buffer
+        self.capture_index = 0
+        self.latest_slot = None  # Buffer holding the published frame
         
         # Load MobileNet SSD model for person detection
         self.prototxt = 'MobileNetSSD_deploy.prototxt'
@@ -29,13 +372,17 @@ class PeopleCounterCamera:
                        "bottle", "bus", "car", "cat", "chair", "cow", "diningtable",
                        "dog", "horse", "motorbike", "person", "pottedplant",
                        "sheep", "sofa", "train", "tvmonitor"]
+        self.person_class_id = self.CLASSES.index("person")
         
         # People counting state variables
         self.tracking_data = {}  # Store tracking info for detected people
         self.next_person_id = 1
-        self.count_events = []  # Store count events to be saved to database
-        self.backup_events = []  # Backup storage in case database fails
+        self.max_pending_events = 10000  # Limit events waiting to be saved
         self.max_backup_events = 1000  # Limit backup storage
+        # Count events to be saved to database; shared between the pipeline and web threads
+        self.count_events = EventBuffer(self.max_pending_events)
+        self.count_events.register_consumer('database')
+        self.backup_events = EventBuffer(self.max_backup_events)  # Backup storage in case database fails
         
         # Counting zones (will be set based on frame dimensions)
         self.entry_zone = None
@@ -46,8 +393,38 @@ class PeopleCounterCamera:
         self.max_disappeared = 10  # Frames before removing tracker
         self.min_confidence = 0.5
         self.min_distance_for_tracking = 50  # Minimum distance for tracking
+        self.detection_stride = 1  # Captured frames per detection; people move further when frames are skipped
+        self.hysteresis_band = None  # Dead zone around the counting line (set with the zones)
+        
+        # Re-identification settings: unmatched detections are compared by appearance with
+        # tracks not seen this frame, so briefly occluded people keep their ID and crossing state
+        self.reid_min_similarity = 0.8  # Cosine similarity of color histograms
+        self.reid_max_distance = 250  # Pixels a lost person may move and still be re-associated
+        self.embedding_momentum = 0.7  # Weight of the previous appearance when updating a track
+        
+        # Adaptive inference keeps detection real-time on slow hardware or in busy scenes
+        self.inference_scheduler = None
+        if self.capture_config['adaptive_inference']:
+            target_fps = self.capture_config['target_fps']
+            if target_fps is not None and not (math.isfinite(target_fps) and target_fps > 0):
+                logger.warning(f"Ignoring invalid target fps {target_fps!r}, keeping up with the capture fps instead")
+                target_fps = None
+            self.inference_scheduler = InferenceScheduler(target_fps or self.capture_config['fps'],
+                                                          max_size=self.inference_size)
+        
+        # Processing pipeline shared by all viewers; in headless mode nothing is drawn or
+        # encoded unless a client explicitly asks for the video feed
+        self.headless = headless
+        self.frame_condition = Condition()
+        self.frame_seq = 0
+        self.latest_frame = None
+        self.latest_detections = []
+        self.latest_tracks = []
+        self.pipeline_thread = None
+        self.stop_event = Event()
+        self.frame_listeners = []  # Callables notified with the sequence number of each new frame
         
-        logger.info("PeopleCounterCamera initialized successfully")
+        logger.info(f"PeopleCounterCamera initialized successfully (headless: {headless})")
     
     def setup_counting_zones(self, frame_width, frame_height):
         """Set up entry/exit zones based on frame dimensions"""
@@ -70,7 +447,12 @@ class PeopleCounterCamera:
             'y2': frame_height
         }
         
-        logger.info(f"Counting zones set up - Line at X: {self.counting_line_x}")
+        # A track must move from one side of this band to the other to count, so people
+        # jittering around the line do not generate repeated IN/OUT events
+        self.hysteresis_band = max(10, int(frame_width * 0.03))
+        
+        logger.info(f"Counting zones set up - Line at X: {self.counting_line_x} "
+                    f"(hysteresis ±{self.hysteresis_band}px)")
     
     def detect_people(self, frame):
         """Detect people in the frame using MobileNet SSD"""
@@ -80,32 +462,34 @@ class PeopleCounterCamera:
         if not hasattr(self, 'counting_line_x') or self.counting_line_x is None:
             self.setup_counting_zones(width, height)
         
-        # Prepare input blob
-        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)),
-                                   0.007843, (300, 300), 127.5)
+        # Prepare input blob in reused buffers
+        self.preprocessor.size = self.inference_size
+        blob = self.preprocessor.prepare(frame)
         self.net.setInput(blob)
         detections = self.net.forward()
         
         people_detections = []
         
+        # Keep confident person detections in one vectorised pass
+        rows = detections[0, 0]
+        keep = (rows[:, 2] > self.min_confidence) & (rows[:, 1] == self.person_class_id)
+        boxes = (rows[keep, 3:7] * np.array([width, height, width, height])).astype(int)
+        
         # Process detections
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > self.min_confidence:
-                idx = int(detections[0, 0, i, 1])
-                if self.CLASSES[idx] == "person":
-                    box = detections[0, 0, i, 3:7] * np.array([width, height, width, height])
-                    (startX, startY, endX, endY) = box.astype("int")
-                    
-                    # Calculate center point
-                    centerX = (startX + endX) // 2
-                    centerY = (startY + endY) // 2
-                    
-                    people_detections.append({
-                        'confidence': float(confidence),
-                        'bbox': [int(startX), int(startY), int(endX - startX), int(endY - startY)],
-                        'center': (centerX, centerY)
-                    })
+        for (startX, startY, endX, endY), confidence in zip(boxes.tolist(), rows[keep, 2].tolist()):
+            # Mirror coordinates instead of flipping the whole frame
+            if self.mirror:
+                startX, endX = width - endX, width - startX
+            
+            # Calculate center point
+            centerX = (startX + endX) // 2
+            centerY = (startY + endY) // 2
+            
+            people_detections.append({
+                'confidence': confidence,
+                'bbox': [startX, startY, endX - startX, endY - startY],
+                'center': (centerX, centerY)
+            })
         
         return people_detections
     
@@ -113,44 +497,87 @@ class PeopleCounterCamera:
         """Calculate Euclidean distance between two points"""
         return np.sqrt((center1[0] - center2[0])**2 + (center1[1] - center2[1])**2)
     
-    def update_tracking(self, detections):
+    def compute_embeddings(self, frame, detections):
+        """Appearance embeddings (normalised hue/saturation histograms) for all detections"""
+        height, width = frame.shape[:2]
+        embeddings = np.zeros((len(detections), 16 * 8), dtype=np.float32)
+        
+        for i, detection in enumerate(detections):
+            x, y, w, h = detection['bbox']
+            # Boxes are in mirrored coordinates; crop from the unmirrored frame
+            if self.mirror:
+                x = width - (x + w)
+            x1, y1 = max(x, 0), max(y, 0)
+            x2, y2 = min(x + w, width), min(y + h, height)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            
+            # Every other pixel is plenty for a color histogram
+            crop = frame[y1:y2:2, x1:x2:2]
+            hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+            hist = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256]).ravel()
+            norm = np.linalg.norm(hist)
+            if norm > 0:
+                embeddings[i] = hist / norm
+        
+        return embeddings
+    
+    def update_tracking(self, detections, frame=None):
         """Update person tracking and detect entry/exit events"""
         current_time = time.time()
+        track_ids = list(self.tracking_data.keys())
+        
+        # Appearance is only needed when a frame is available for re-identification
+        embeddings = self.compute_embeddings(frame, detections) if frame is not None and detections else None
         
-        # Match detections to existing tracks
-        matched_tracks = set()
+        assignments = []  # (detection index, track id)
         unmatched_detections = list(range(len(detections)))
+        unmatched_tracks = list(range(len(track_ids)))
         
-        for track_id, track_data in list(self.tracking_data.items()):
-            best_match = None
-            best_distance = float('inf')
+        if track_ids and detections:
+            # Distances between every track and every detection in one batch
+            track_centers = np.array([self.tracking_data[t]['last_center'] for t in track_ids], dtype=np.float32)
+            detection_centers = np.array([d['center'] for d in detections], dtype=np.float32)
+            distances = np.linalg.norm(track_centers[:, None, :] - detection_centers[None, :, :], axis=2)
             
-            for i, detection in enumerate(detections):
-                if i in matched_tracks:
-                    continue
-                
-                distance = self.calculate_distance(track_data['last_center'], detection['center'])
-                
-                if distance < self.min_distance_for_tracking and distance < best_distance:
-                    best_distance = distance
-                    best_match = i
+            # Match detections to existing tracks, closest pairs first
+            for track_idx, detection_idx in greedy_match(distances, self.min_distance_for_tracking * self.detection_stride):
+                assignments.append((detection_idx, track_ids[track_idx]))
+                unmatched_detections.remove(detection_idx)
+                unmatched_tracks.remove(track_idx)
             
-            if best_match is not None:
-                # Update existing track
-                detection = detections[best_match]
-                old_center = track_data['last_center']
-                new_center = detection['center']
-                
-                # Check for line crossing (entry/exit event)
-                self.check_line_crossing(track_id, old_center, new_center, detection['confidence'])
-                
-                # Update track data
-                track_data['last_center'] = new_center
-                track_data['last_seen'] = current_time
-                track_data['confidence'] = detection['confidence']
-                
-                matched_tracks.add(best_match)
-                unmatched_detections.remove(best_match)
+            # Re-associate remaining detections with unmatched tracks that look the same
+            if embeddings is not None and unmatched_detections and unmatched_tracks:
+                candidates = [t for t in unmatched_tracks if self.tracking_data[track_ids[t]].get('embedding') is not None]
+                if candidates:
+                    track_embeddings = np.stack([self.tracking_data[track_ids[t]]['embedding'] for t in candidates])
+                    similarity = embeddings[unmatched_detections] @ track_embeddings.T
+                    cost = 1.0 - similarity
+                    cost[distances[candidates][:, unmatched_detections].T >= self.reid_max_distance] = np.inf
+                    
+                    for row, col in greedy_match(cost, 1.0 - self.reid_min_similarity):
+                        detection_idx = unmatched_detections[row]
+                        track_id = track_ids[candidates[col]]
+                        assignments.append((detection_idx, track_id))
+                        logger.info(f"Re-identified person {track_id} (similarity: {similarity[row, col]:.2f})")
+                    matched = {detection_idx for detection_idx, _ in assignments}
+                    unmatched_detections = [d for d in unmatched_detections if d not in matched]
+        
+        for detection_idx, track_id in assignments:
+            # Update existing track
+            track_data = self.tracking_data[track_id]
+            detection = detections[detection_idx]
+            new_center = detection['center']
+            
+            # Check for line crossing (entry/exit event)
+            self.check_line_crossing(track_id, track_data, new_center, detection['confidence'])
+            
+            # Update track data
+            track_data['last_center'] = new_center
+            track_data['last_seen'] = current_time
+            track_data['confidence'] = detection['confidence']
+            if embeddings is not None and embeddings[detection_idx].any():
+                self.update_embedding(track_data, embeddings[detection_idx])
         
         # Create new tracks for unmatched detections
         for detection_idx in unmatched_detections:
@@ -159,7 +586,9 @@ class PeopleCounterCamera:
                 'last_center': detection['center'],
                 'last_seen': current_time,
                 'confidence': detection['confidence'],
-                'created_time': current_time
+                'created_time': current_time,
+                'side': self.initial_side(detection['center'][0]),
+                'embedding': embeddings[detection_idx] if embeddings is not None and embeddings[detection_idx].any() else None
             }
             self.next_person_id += 1
         
@@ -172,80 +601,114 @@ class PeopleCounterCamera:
         for track_id in tracks_to_remove:
             del self.tracking_data[track_id]
     
-    def check_line_crossing(self, track_id, old_center, new_center, confidence):
+    def update_embedding(self, track_data, embedding):
+        """Blend a new appearance observation into a track's embedding"""
+        previous = track_data.get('embedding')
+        if previous is None:
+            track_data['embedding'] = embedding
+            return
+        blended = self.embedding_momentum * previous + (1.0 - self.embedding_momentum) * embedding
+        track_data['embedding'] = blended / np.linalg.norm(blended)
+    
+    def zone_side(self, x):
+        """Which side of the counting line x lies on, or None inside the hysteresis band"""
+        if x < self.counting_line_x - self.hysteresis_band:
+            return 'exit'
+        if x > self.counting_line_x + self.hysteresis_band:
+            return 'entry'
+        return None
+    
+    def initial_side(self, x):
+        """Side of a new track; inside the band it is provisional, taken from the line itself.
+        
+        A track first seen near the line (detection started late, or re-identification
+        failed) then counts as soon as it leaves the band on the other side.
+        """
+        return self.zone_side(x) or ('exit' if x < self.counting_line_x else 'entry')
+    
+    def check_line_crossing(self, track_id, track_data, new_center, confidence):
         """Check if a person crossed the counting line and determine direction"""
-        old_x = old_center[0]
-        new_x = new_center[0]
-        line_x = self.counting_line_x
+        new_side = self.zone_side(new_center[0])
+        old_side = track_data.get('side')
         
-        # Check if line was crossed
-        if (old_x < line_x < new_x) or (old_x > line_x > new_x):
-            direction = None
-            
-            if old_x < line_x < new_x:
-                # Moved from exit zone to entry zone = ENTRY
-                direction = 'IN'
-            elif old_x > line_x > new_x:
-                # Moved from entry zone to exit zone = EXIT
-                direction = 'OUT'
-            
-            if direction:
-                # Create count event
-                event = {
-                    'direction': direction,
-                    'people_count': 1,
-                    'confidence': confidence,
-                    'timestamp': datetime.now(),
-                    'track_id': track_id
-                }
-                
-                self.count_events.append(event)
-                logger.info(f"Count event: Person {track_id} - {direction} (confidence: {confidence:.2f})")
+        # Inside the band, or still on the same side: no change of state
+        if new_side is None or new_side == old_side:
+            return
+        track_data['side'] = new_side
+        
+        if new_side == 'entry':
+            # Moved from exit zone to entry zone = ENTRY
+            direction = 'IN'
+        else:
+            # Moved from entry zone to exit zone = EXIT
+            direction = 'OUT'
+        
+        # Create count event; event_id lets the database recognise an event it already saved
+        event = {
+            'event_id': uuid.uuid4().hex,
+            'direction': direction,
+            'people_count': 1,
+            'confidence': confidence,
+            'timestamp': datetime.now(),
+            'track_id': track_id
+        }
+        
+        self.count_events.append(event)
+        logger.info(f"Count event: Person {track_id} - {direction} (confidence: {confidence:.2f})")
     
     def get_and_clear_events(self):
-        """Get all count events and clear the buffer"""
-        events = self.count_events.copy()
+        """Get count events not yet handed to the database and advance its cursor"""
+        events = self.count_events.consume('database')
         
-        # Backup events before clearing (in case database save fails)
+        # Backup events in case database save fails
         if events:
             self.backup_events.extend(events)
-            # Keep backup within limits
-            if len(self.backup_events) > self.max_backup_events:
-                self.backup_events = self.backup_events[-self.max_backup_events:]
             logger.info(f"📦 Backed up {len(events)} events, total backup: {len(self.backup_events)}")
         
-        self.count_events.clear()
         return events
     
     def get_backup_events(self):
         """Get backup events (in case of database recovery)"""
-        return self.backup_events.copy()
+        return self.backup_events.snapshot()
     
     def clear_backup_events(self):
         """Clear backup events after successful database recovery"""
-        cleared_count = len(self.backup_events)
-        self.backup_events.clear()
+        cleared_count = self.backup_events.clear()
         logger.info(f"🧹 Cleared {cleared_count} backup events")
         return cleared_count
     
-    def draw_interface(self, frame):
+    def get_inference_stats(self):
+        """Current detection settings and, when adaptive, the scheduler state"""
+        if self.inference_scheduler is not None:
+            return self.inference_scheduler.stats()
+        return {'input_size': self.inference_size, 'skip_frames': 0, 'min_confidence': self.min_confidence}
+    
+    def get_event_buffer_stats(self):
+        """Backpressure metrics for the pending and backup event buffers"""
+        return {
+            'pending': self.count_events.stats(),
+            'backup': self.backup_events.stats()
+        }
+    
+    def draw_interface(self, frame, scale=1.0):
         """Draw counting interface on frame"""
         height, width = frame.shape[:2]
+        line_x = int(self.counting_line_x * scale)
         
         # Draw counting line
-        cv2.line(frame, (self.counting_line_x, 0), (self.counting_line_x, height), (0, 255, 255), 3)
+        cv2.line(frame, (line_x, 0), (line_x, height), (0, 255, 255), 3)
         
         # Draw zone labels
         cv2.putText(frame, "EXIT ZONE", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(frame, "ENTRY ZONE", (self.counting_line_x + 10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        cv2.putText(frame, "ENTRY ZONE", (line_x + 10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
         
         # Draw counting line label
-        cv2.putText(frame, "COUNTING LINE", (self.counting_line_x - 100, height//2 - 10), 
+        cv2.putText(frame, "COUNTING LINE", (line_x - 100, height//2 - 10), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
         
         # Draw tracking info
         active_tracks = len(self.tracking_data)
-        pending_events = len(self.count_events)
+        pending_events = self.count_events.stats()['lag'].get('database', 0)
         
         cv2.putText(frame, f"Active Tracks: {active_tracks}", (10, 70), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
@@ -254,66 +717,260 @@ class PeopleCounterCamera:
         
         return frame
     
-    def generate_frames(self):
-        """Generate frames for video streaming with people counting"""
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                logger.error("Failed to read frame from camera")
-                break
+    def draw_detections(self, frame, detections, tracks, scale=1.0):
+        """Draw detection boxes, track IDs and interface elements on frame.
+        
+        Coordinates are in capture resolution and multiplied by `scale` so the overlay
+        can be drawn on an already downscaled output frame.
+        """
+        def point(p):
+            return int(p[0] * scale), int(p[1] * scale)
+        
+        # Draw person detection boxes and tracking
+        for detection in detections:
+            bbox = detection['bbox']
+            confidence = detection['confidence']
+            center = point(detection['center'])
+            
+            startX, startY = point(bbox[:2])
+            endX, endY = point((bbox[0] + bbox[2], bbox[1] + bbox[3]))
             
-            # Flip frame horizontally for mirror effect
-            frame = cv2.flip(frame, 1)
+            # Draw bounding box
+            cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
             
-            # Detect people
-            people_detections = self.detect_people(frame)
+            # Draw center point
+            cv2.circle(frame, center, 5, (255, 0, 0), -1)
             
-            # Update tracking and detect events
-            self.update_tracking(people_detections)
+            # Draw confidence
+            label = f"Person: {confidence:.2f}"
+            cv2.putText(frame, label, (startX, startY - 10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        
+        # Draw tracking trails
+        for track_id, center in tracks:
+            center = point(center)
+            cv2.circle(frame, center, 8, (255, 255, 0), 2)
+            cv2.putText(frame, f"ID:{track_id}", (center[0] + 10, center[1] - 10),
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
+        
+        # Draw interface elements
+        frame = self.draw_interface(frame, scale)
+        
+        # People count display
+        cv2.putText(frame, f"People detected: {len(detections)}", 
+                   (10, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        
+        return frame
+    
+    def start(self):
+        """Start the background capture and counting pipeline if it is not running"""
+        if self.pipeline_thread is not None and self.pipeline_thread.is_alive():
+            return
+        
+        self.stop_event.clear()
+        self.pipeline_thread = Thread(target=self.run_pipeline, name='people-counter-pipeline', daemon=True)
+        self.pipeline_thread.start()
+        logger.info("People counting pipeline started")
+    
+    def stop(self):
+        """Stop the background pipeline"""
+        self.stop_event.set()
+        if self.pipeline_thread is not None:
+            self.pipeline_thread.join(timeout=2.0)
+        self.pipeline_thread = None
+    
+    def read_frame(self):
+        """Read the next frame into a pool buffer that no viewer can be reading"""
+        with self.frame_condition:
+            index = next((i for i in range(len(self.capture_pool))
+                          if i != self.latest_slot and self.frame_readers[i] == 0), None)
+            if index is None:
+                self.capture_pool.append(None)
+                self.frame_readers.append(0)
+                index = len(self.capture_pool) - 1
+                logger.info(f"All capture buffers in use by viewers, pool grown to {len(self.capture_pool)}")
+        
+        ret, frame = self.cap.read(self.capture_pool[index])
+        if ret:
+            # read() reuses the buffer when its size matches, otherwise returns a new one we keep
+            self.capture_pool[index] = frame
+            self.capture_index = index
+        return ret, frame
+    
+    def run_pipeline(self):
+        """Capture frames, detect and track people, and publish the latest results"""
+        scheduler = self.inference_scheduler
+        people_detections, tracks = [], []
+        
+        while not self.stop_event.is_set():
+            ret, frame = self.read_frame()
+            if not ret:
+                logger.error("Failed to read frame from camera")
+                break
             
-            # Draw person detection boxes and tracking
-            for i, detection in enumerate(people_detections):
-                bbox = detection['bbox']
-                confidence = detection['confidence']
-                center = detection['center']
+            # Skipped frames are still published, with the results of the last detection
+            if scheduler is None or scheduler.should_detect():
+                if scheduler is not None:
+                    self.inference_size, skip, self.min_confidence = scheduler.settings
+                    self.detection_stride = skip + 1
+                started = time.perf_counter()
                 
-                startX, startY = bbox[0], bbox[1]
-                endX, endY = startX + bbox[2], startY + bbox[3]
+                # Detect people (coordinates come back mirrored when mirror mode is on)
+                people_detections = self.detect_people(frame)
                 
-                # Draw bounding box
-                cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
+                # Update tracking and detect events
+                self.update_tracking(people_detections, frame)
                 
-                # Draw center point
-                cv2.circle(frame, center, 5, (255, 0, 0), -1)
+                tracks = [(track_id, track_data['last_center'])
+                          for track_id, track_data in self.tracking_data.items()]
                 
-                # Draw confidence
-                label = f"Person: {confidence:.2f}"
-                cv2.putText(frame, label, (startX, startY - 10),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                if scheduler is not None:
+                    scheduler.record(time.perf_counter() - started, len(people_detections))
+            
+            # Publish results; the frame itself is never modified after this point
+            with self.frame_condition:
+                self.latest_frame = frame
+                self.latest_slot = self.capture_index
+                self.latest_detections = people_detections
+                self.latest_tracks = tracks
+                self.frame_seq += 1
+                self.frame_condition.notify_all()
+            
+            for listener in self.frame_listeners:
+                listener(self.frame_seq)
+        
+        # Wake any waiting streams so they can exit
+        with self.frame_condition:
+            self.frame_condition.notify_all()
+        logger.info("People counting pipeline stopped")
+    
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Wait for a frame newer than last_seq, returning (seq, frame, detections, tracks) or None"""
+        with self.frame_condition:
+            if self.frame_seq <= last_seq:
+                self.frame_condition.wait(timeout)
+            if self.frame_seq <= last_seq:
+                return None
+            return self.frame_seq, self.latest_frame, self.latest_detections, self.latest_tracks
+    
+    def peek_frame(self):
+        """Return the latest (seq, frame, detections, tracks) without waiting"""
+        with self.frame_condition:
+            return self.frame_seq, self.latest_frame, self.latest_detections, self.latest_tracks
+    
+    @contextmanager
+    def pinned_frame(self):
+        """Latest (seq, frame, detections, tracks); capture will not write into the frame until exit"""
+        with self.frame_condition:
+            slot = self.latest_slot
+            if slot is not None:
+                self.frame_readers[slot] += 1
+            latest = (self.frame_seq, self.latest_frame, self.latest_detections, self.latest_tracks)
+        try:
+            yield latest
+        finally:
+            if slot is not None:
+                with self.frame_condition:
+                    self.frame_readers[slot] -= 1
+    
+    def add_frame_listener(self, listener):
+        """Register a callable invoked from the pipeline thread after each new frame"""
+        self.frame_listeners.append(listener)
+    
+    def render_jpeg(self, encoder, frame, detections, tracks, overlay=True):
+        """Draw the overlay (optionally) and encode a published frame for one output variant"""
+        # Scale first so mirroring and drawing touch only the output-sized frame
+        output = encoder.scale(frame)
+        scale = output.shape[1] / frame.shape[1]
+        
+        if self.mirror:
+            output = encoder.mirror(output)
+        elif overlay and output is frame:
+            # Draw on a private copy since the published frame is shared between viewers
+            output = frame.copy()
+        
+        if overlay:
+            output = self.draw_detections(output, detections, tracks, scale)
+        return encoder.compress(output)
+    
+    def pipeline_running(self):
+        """Check whether the background pipeline is alive"""
+        return self.pipeline_thread is not None and self.pipeline_thread.is_alive()
+    
+    def generate_frames(self, width=None, quality=None, max_fps=None, overlay=True):
+        """Generate frames for video streaming with people counting"""
+        encoder = StreamEncoder(width=width, quality=quality, max_fps=max_fps)
+        self.start()
+        last_seq = 0
+        
+        while True:
+            result = self.wait_for_frame(last_seq)
+            if result is None:
+                if not self.pipeline_running():
+                    break
+                continue
+            last_seq = result[0]
             
-            # Draw tracking trails
-            for track_id, track_data in self.tracking_data.items():
-                center = track_data['last_center']
-                cv2.circle(frame, center, 8, (255, 255, 0), 2)
-                cv2.putText(frame, f"ID:{track_id}", (center[0] + 10, center[1] - 10),
-                          cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 0), 1)
+            # Counting runs in the pipeline on every frame; only frames due under the fps limit are sent
+            if not encoder.should_send(time.monotonic()):
+                continue
             
-            # Draw interface elements
-            frame = self.draw_interface(frame)
+            # Encode the latest frame as JPEG while keeping capture out of its buffer
+            with self.pinned_frame() as (last_seq, frame, people_detections, tracks):
+                frame_bytes = self.render_jpeg(encoder, frame, people_detections, tracks, overlay)
+            if frame_bytes:
+                # Yield parts separately to avoid copying the JPEG into a concatenated chunk;
+                # the time spent suspended in yield is how long the server took to send it
+                send_start = time.monotonic()
+                yield b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+                yield frame_bytes
+                yield b'\r\n'
+                now = time.monotonic()
+                encoder.record_send(now, now - send_start)
+    
+    def detections_payload(self, seq, frame, detections, tracks):
+        """Build a compact JSON-serialisable description of one processed frame"""
+        height, width = frame.shape[:2]
+        return {
+            'seq': seq,
+            'w': width,
+            'h': height,
+            'line': self.counting_line_x,
+            # [x, y, w, h, confidence %]
+            'boxes': [detection['bbox'] + [int(detection['confidence'] * 100)] for detection in detections],
+            # [track id, center x, center y]
+            'tracks': [[int(track_id), int(center[0]), int(center[1])] for track_id, center in tracks]
+        }
+    
+    def generate_detections(self, max_fps=None):
+        """Generate a server-sent event stream of per-frame boxes and track IDs"""
+        frame_interval = 1.0 / max_fps if max_fps else 0.0
+        last_sent = 0.0
+        self.start()
+        last_seq = 0
+        
+        while True:
+            result = self.wait_for_frame(last_seq)
+            if result is None:
+                if not self.pipeline_running():
+                    break
+                # Keep-alive comment so proxies do not close an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            last_seq = result[0]
             
-            # People count display
-            cv2.putText(frame, f"People detected: {len(people_detections)}", 
-                       (10, frame.shape[0] - 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            now = time.monotonic()
+            if now - last_sent < frame_interval:
+                continue
+            last_sent = now
             
-            # Encode frame as JPEG
-            ret, buffer = cv2.imencode('.jpg', frame)
-            if ret:
-                frame_bytes = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+            payload = self.detections_payload(*result)
+            yield f"data: {json.dumps(payload, separators=(',', ':'))}\n\n"
     
     def __del__(self):
         """Cleanup resources"""
+        if hasattr(self, 'stop_event'):
+            self.stop_event.set()
         if hasattr(self, 'cap'):
             self.cap.release()
         logger.info("PeopleCounterCamera resources cleaned up") 
\ No newline at end of file
@@ -0,0 +1,145 @@
+from threading import Lock, Condition
+
+class EventBuffer:
+    """Bounded, thread-safe ring buffer of events with monotonically increasing sequence numbers.
+
+    Producers append events, and each consumer reads from its own cursor without clearing
+    the buffer, so several readers can see the same events. When the buffer is full the
+    oldest event is overwritten, and any consumer that had not read it yet counts it as dropped.
+    """
+
+    def __init__(self, capacity=1000):
+        """Create an empty buffer holding at most `capacity` events"""
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.lock = Lock()
+        self.condition = Condition(self.lock)  # Signalled whenever events are appended
+        self.listeners = []  # Callables notified (outside the lock) after events are appended
+
+        # Sequence numbers start at 1 so a cursor of 0 means "nothing read yet"
+        self.first_seq = 1  # Oldest retained event
+        self.next_seq = 1   # Sequence number the next event will get
+        self.cursors = {}   # Consumer name -> last sequence number read
+
+        # Backpressure metrics
+        self.total_appended = 0
+        self.dropped = {}   # Consumer name -> events overwritten before that consumer read them
+        self.high_water = 0
+
+    def register_consumer(self, name):
+        """Start tracking a consumer cursor at the oldest retained event"""
+        with self.lock:
+            self.cursors.setdefault(name, self.first_seq - 1)
+            self.dropped.setdefault(name, 0)
+
+    def _append_locked(self, event):
+        """Store one event; the caller must hold the lock"""
+        seq = self.next_seq
+        self.slots[seq % self.capacity] = event
+        self.next_seq += 1
+        self.total_appended += 1
+
+        # Trim by moving the start forward instead of copying the buffer
+        if self.next_seq - self.first_seq > self.capacity:
+            evicted = self.first_seq
+            self.first_seq += 1
+            for name, cursor in self.cursors.items():
+                if cursor < evicted:
+                    self.cursors[name] = evicted
+                    self.dropped[name] += 1
+
+        self.high_water = max(self.high_water, self.next_seq - self.first_seq)
+        return seq
+
+    def add_listener(self, listener):
+        """Register a callable invoked with the newest sequence number after each append"""
+        self.listeners.append(listener)
+
+    def _notify_listeners(self, seq):
+        for listener in self.listeners:
+            listener(seq)
+
+    def append(self, event):
+        """Append an event and return its sequence number"""
+        with self.lock:
+            seq = self._append_locked(event)
+            self.condition.notify_all()
+        self._notify_listeners(seq)
+        return seq
+
+    def extend(self, events):
+        """Append several events under a single lock acquisition"""
+        with self.lock:
+            seqs = [self._append_locked(event) for event in events]
+            self.condition.notify_all()
+        if seqs:
+            self._notify_listeners(seqs[-1])
+        return seqs
+
+    def _read_locked(self, since, limit=None):
+        """Return (seq, event) pairs newer than `since`; the caller must hold the lock"""
+        start = max(since + 1, self.first_seq)
+        end = self.next_seq if limit is None else min(self.next_seq, start + limit)
+        return [(seq, self.slots[seq % self.capacity]) for seq in range(start, end)]
+
+    def read_since(self, since, limit=None):
+        """Return (seq, event) pairs with sequence numbers greater than `since`"""
+        with self.lock:
+            return self._read_locked(since, limit)
+
+    def wait_since(self, since, timeout, limit=None):
+        """Like read_since, but block up to `timeout` seconds until a newer event arrives"""
+        with self.lock:
+            self.condition.wait_for(lambda: self.next_seq - 1 > since, timeout)
+            return self._read_locked(since, limit)
+
+    def consume(self, name, limit=None):
+        """Return the events a named consumer has not seen yet and advance its cursor"""
+        with self.lock:
+            if name not in self.cursors:
+                self.cursors[name] = self.first_seq - 1
+                self.dropped[name] = 0
+            cursor = self.cursors[name]
+            items = self._read_locked(cursor, limit)
+            if items:
+                self.cursors[name] = items[-1][0]
+            return [event for _, event in items]
+
+    def snapshot(self):
+        """Return all retained events, oldest first"""
+        with self.lock:
+            return [event for _, event in self._read_locked(0)]
+
+    def clear(self):
+        """Drop all retained events; sequence numbers keep increasing afterwards"""
+        with self.lock:
+            cleared = self.next_seq - self.first_seq
+            for seq in range(self.first_seq, self.next_seq):
+                self.slots[seq % self.capacity] = None
+            self.first_seq = self.next_seq
+            for name in self.cursors:
+                self.cursors[name] = max(self.cursors[name], self.first_seq - 1)
+            return cleared
+
+    @property
+    def latest_seq(self):
+        """Sequence number of the newest event (0 if none has been appended)"""
+        with self.lock:
+            return self.next_seq - 1
+
+    def __len__(self):
+        with self.lock:
+            return self.next_seq - self.first_seq
+
+    def stats(self):
+        """Backpressure metrics: occupancy, per-consumer lag and dropped counts"""
+        with self.lock:
+            return {
+                'size': self.next_seq - self.first_seq,
+                'capacity': self.capacity,
+                'latest_seq': self.next_seq - 1,
+                'total_appended': self.total_appended,
+                'high_water': self.high_water,
+                'lag': {name: self.next_seq - 1 - cursor for name, cursor in self.cursors.items()},
+                'dropped': dict(self.dropped)
+            }
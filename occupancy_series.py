@@ -0,0 +1,206 @@
+import logging
+import os
+import time
+from datetime import datetime
+from threading import Lock
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Resolution name -> (bucket length in seconds, buckets kept)
+RESOLUTIONS = {
+    'second': (1, 3600),       # Last hour
+    'minute': (60, 1440),      # Last day
+    'quarter': (900, 31 * 96), # Last month, 15-minute buckets
+}
+
+class RingSeries:
+    """Fixed-size ring of time buckets holding the last and peak occupancy seen in each bucket.
+
+    Bucket numbers are epoch seconds divided by the bucket length, and bucket n lives in
+    slot n % capacity, so recording and reading never shift data around. Quiet buckets
+    between two recorded values are filled with the earlier value when the later one
+    arrives, because occupancy stays the same until someone crosses the line.
+    """
+
+    def __init__(self, step, capacity):
+        self.step = step
+        self.capacity = capacity
+        self.buckets = np.full(capacity, -1, dtype=np.int64)  # Bucket number held by each slot
+        self.last = np.zeros(capacity, dtype=np.int32)
+        self.peak = np.zeros(capacity, dtype=np.int32)
+        self.latest_bucket = -1
+
+    def record(self, bucket, occupancy):
+        """Record the occupancy at a point in time; the caller must hold the series lock"""
+        pos = bucket % self.capacity
+
+        if bucket > self.latest_bucket:
+            if self.latest_bucket >= 0:
+                # Carry the previous value across the quiet buckets still inside the window
+                carried = self.last[self.latest_bucket % self.capacity]
+                gap = np.arange(max(self.latest_bucket + 1, bucket - self.capacity + 1), bucket)
+                self.buckets[gap % self.capacity] = gap
+                self.last[gap % self.capacity] = carried
+                self.peak[gap % self.capacity] = carried
+            self.buckets[pos] = bucket
+            self.last[pos] = occupancy
+            self.peak[pos] = occupancy
+            self.latest_bucket = bucket
+        elif self.buckets[pos] == bucket:
+            # A late event only raises the peak; later buckets already carry newer values
+            if bucket == self.latest_bucket:
+                self.last[pos] = occupancy
+            self.peak[pos] = max(self.peak[pos], occupancy)
+
+    def window(self, end_bucket, points):
+        """Return (last, peak) lists for the `points` buckets ending at end_bucket.
+
+        Buckets after the newest recorded one repeat its value; buckets before the
+        oldest retained one are None.
+        """
+        wanted = np.arange(end_bucket - points + 1, end_bucket + 1)
+        pos = wanted % self.capacity
+        known = self.buckets[pos] == wanted
+        last = self.last[pos]
+        peak = self.peak[pos]
+
+        if self.latest_bucket >= 0 and end_bucket > self.latest_bucket:
+            carried = self.last[self.latest_bucket % self.capacity]
+            after = wanted > self.latest_bucket
+            last = np.where(after, carried, last)
+            peak = np.where(after, carried, peak)
+            known |= after
+
+        return ([int(v) if k else None for v, k in zip(last, known)],
+                [int(v) if k else None for v, k in zip(peak, known)])
+
+    def clear(self):
+        self.buckets.fill(-1)
+        self.last.fill(0)
+        self.peak.fill(0)
+        self.latest_bucket = -1
+
+class OccupancySeries:
+    """Occupancy over time at several resolutions, updated incrementally as events are saved.
+
+    Each resolution is a RingSeries, so memory is fixed and a chart of N points costs O(N)
+    no matter how many events have been counted. The series is saved to `path` every
+    `persist_interval` seconds (when it changed) and loaded back on startup.
+    """
+
+    def __init__(self, path=None, persist_interval=60.0):
+        self.path = path
+        self.persist_interval = persist_interval
+        self.lock = Lock()
+        self.rings = {name: RingSeries(step, capacity) for name, (step, capacity) in RESOLUTIONS.items()}
+        self.dirty = False
+        self.last_saved = time.monotonic()
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def record(self, timestamp, occupancy):
+        """Record the occupancy right after an event; timestamp is a local datetime or epoch seconds"""
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        with self.lock:
+            for ring in self.rings.values():
+                ring.record(int(timestamp // ring.step), occupancy)
+            self.dirty = True
+
+    def start_day(self, midnight):
+        """Drop occupancy to 0 at local midnight, as the daily counts do; returns True if recorded.
+
+        Nothing is recorded for an empty series or when the finest resolution already has a
+        value from midnight on, so calling this on every save loop is cheap and idempotent.
+        """
+        timestamp = midnight.timestamp()
+        with self.lock:
+            finest = self.rings['second']
+            if finest.latest_bucket < 0 or finest.latest_bucket * finest.step >= timestamp:
+                return False
+            for ring in self.rings.values():
+                ring.record(int(timestamp // ring.step), 0)
+            self.dirty = True
+        return True
+
+    def series(self, resolution, points=None, now=None):
+        """Return the latest `points` buckets at a resolution, ending at the current bucket"""
+        ring = self.rings[resolution]
+        points = ring.capacity if points is None else min(max(points, 1), ring.capacity)
+        end_bucket = int((time.time() if now is None else now) // ring.step)
+
+        with self.lock:
+            occupancy, peak = ring.window(end_bucket, points)
+
+        start = (end_bucket - points + 1) * ring.step
+        return {
+            'resolution': resolution,
+            'step': ring.step,
+            'start': datetime.fromtimestamp(start).isoformat(),
+            'start_epoch': start,
+            'occupancy': occupancy,
+            'peak': peak
+        }
+
+    def clear(self):
+        with self.lock:
+            for ring in self.rings.values():
+                ring.clear()
+            self.dirty = True
+
+    def save(self):
+        """Write the series to disk atomically; returns True if anything was written"""
+        if not self.path:
+            return False
+
+        with self.lock:
+            if not self.dirty:
+                return False
+            arrays = {}
+            for name, ring in self.rings.items():
+                arrays[f'{name}_buckets'] = ring.buckets.copy()
+                arrays[f'{name}_last'] = ring.last.copy()
+                arrays[f'{name}_peak'] = ring.peak.copy()
+                arrays[f'{name}_latest'] = np.array(ring.latest_bucket)
+            self.dirty = False
+            self.last_saved = time.monotonic()
+
+        # Write outside the lock, then swap in the new file so a crash never leaves half a file
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.error(f"❌ Failed to save occupancy series: {e}")
+            with self.lock:
+                self.dirty = True
+            return False
+
+    def save_if_due(self):
+        """Save when the persist interval has passed since the last save"""
+        if time.monotonic() - self.last_saved >= self.persist_interval:
+            return self.save()
+        return False
+
+    def load(self):
+        """Load a saved series; resolutions whose shape changed since it was saved start empty"""
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                with self.lock:
+                    for name, ring in self.rings.items():
+                        if f'{name}_buckets' not in data or data[f'{name}_buckets'].shape != (ring.capacity,):
+                            continue
+                        ring.buckets[:] = data[f'{name}_buckets']
+                        ring.last[:] = data[f'{name}_last']
+                        ring.peak[:] = data[f'{name}_peak']
+                        ring.latest_bucket = int(data[f'{name}_latest'])
+            logger.info(f"✅ Loaded occupancy series from {self.path}")
+            return True
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Could not load occupancy series, starting empty: {e}")
+            return False